@@ -0,0 +1,236 @@
+"""Schema migrations applied by init_db.
+
+create_all only creates missing tables, so changes to existing tables
+are expressed here as ordered, named steps using alembic's operations
+API. A fresh database is built straight from the models and every step
+is recorded as applied; an existing database runs the steps it has not
+seen yet, each in its own transaction.
+
+Run manually with ``python -m app.migrations``.
+"""
+from datetime import datetime
+from typing import Callable, List, Tuple
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import BigInteger, Column, DateTime, Float, Integer, MetaData, String, Table, JSON, column, null, select, table, text
+from sqlalchemy.engine import Connection, Engine
+from app.models import Bitmask
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+# Arbitrary key for pg_advisory_lock so concurrent replicas migrate one at a time
+ADVISORY_LOCK_ID = 7316001
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("revision", String(64), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+MIGRATIONS: List[Tuple[str, Callable[[Operations, Connection], None]]] = []
+
+def migration(revision: str):
+    """Register a migration step; steps run in declaration order"""
+    def register(fn):
+        MIGRATIONS.append((revision, fn))
+        return fn
+    return register
+
+@migration("0001_game_bitboards")
+def game_bitboards(op: Operations, conn: Connection) -> None:
+    """Store boards as mine/revealed bitmasks instead of nested JSON"""
+    from app.utils.game_engine import GameEngine
+
+    op.add_column("games", Column("mine_mask", Bitmask(), nullable=True))
+    op.add_column("games", Column("revealed_mask", Bitmask(), nullable=True))
+    with op.batch_alter_table("games") as batch:
+        batch.alter_column("grid_state", existing_type=JSON(), nullable=True)
+        batch.alter_column("revealed_cells", existing_type=JSON(), nullable=True)
+
+    games = table(
+        "games",
+        column("id"),
+        column("grid_size"),
+        column("grid_state", JSON()),
+        column("revealed_cells", JSON()),
+        column("mine_mask", Bitmask()),
+        column("revealed_mask", Bitmask()),
+    )
+    last_id = 0
+    converted = 0
+    while True:
+        rows = conn.execute(
+            select(games.c.id, games.c.grid_size, games.c.grid_state, games.c.revealed_cells)
+            .where(games.c.id > last_id, games.c.mine_mask.is_(None))
+            .order_by(games.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            mine_mask, revealed_mask = GameEngine.decode_legacy_board(
+                row.grid_size, row.grid_state, row.revealed_cells
+            )
+            conn.execute(
+                games.update()
+                .where(games.c.id == row.id)
+                .values(
+                    mine_mask=mine_mask,
+                    revealed_mask=revealed_mask,
+                    grid_state=null(),
+                    revealed_cells=null(),
+                )
+            )
+        converted += len(rows)
+        last_id = rows[-1].id
+    logger.info(f"Converted {converted} games to bitmask boards")
+
+@migration("0002_game_state_version")
+def game_state_version(op: Operations, conn: Connection) -> None:
+    """Optimistic version used by the active-game cache write-behind"""
+    op.add_column("games", Column("state_version", Integer(), nullable=False, server_default="0"))
+
+# (table, float column, cents column) converted by 0003_money_minor_units
+MONEY_COLUMNS = [
+    ("users", "balance", "balance_cents"),
+    ("users", "total_wagered", "total_wagered_cents"),
+    ("users", "total_won", "total_won_cents"),
+    ("games", "bet_amount", "bet_cents"),
+    ("games", "prize_amount", "prize_cents"),
+    ("referral_invites", "reward_amount", "reward_cents"),
+]
+
+@migration("0003_money_minor_units")
+def money_minor_units(op: Operations, conn: Connection) -> None:
+    """Integer-cent money columns, wallet version and opening ledger balances"""
+    for table_name, old, new in MONEY_COLUMNS:
+        op.add_column(table_name, Column(new, BigInteger(), nullable=False, server_default="0"))
+        conn.execute(text(f"UPDATE {table_name} SET {new} = CAST(ROUND({old} * 100) AS BIGINT)"))
+    op.add_column("users", Column("version", Integer(), nullable=False, server_default="0"))
+
+    for table_name in ("users", "games", "referral_invites"):
+        with op.batch_alter_table(table_name) as batch:
+            for owner, old, _ in MONEY_COLUMNS:
+                if owner == table_name:
+                    batch.drop_column(old, existing_type=Float())
+
+    # Existing balances predate the ledger; record them as its starting point
+    conn.execute(text(
+        "INSERT INTO ledger (user_id, entry_type, amount_cents, balance_after_cents, created_at) "
+        "SELECT id, 'opening_balance', balance_cents, balance_cents, :now FROM users"
+    ), {"now": datetime.utcnow()})
+
+@migration("0004_users_updated_at_index")
+def users_updated_at_index(op: Operations, conn: Connection) -> None:
+    """Lets the leaderboard pull only users changed since its last sync"""
+    op.create_index("ix_users_updated_at", "users", ["updated_at"])
+
+@migration("0005_casino_aggregates")
+def casino_aggregates(op: Operations, conn: Connection) -> None:
+    """Backfill casino_aggregates (created by create_all) from past games"""
+    from collections import defaultdict
+    from app.database import get_settings
+    from app.models import CasinoAggregate
+    from app.utils.casino_aggregates import bucket_starts
+
+    shards = get_settings().casino_aggregate_shards
+    games = table(
+        "games",
+        column("id"),
+        column("user_id"),
+        column("bet_cents"),
+        column("prize_cents"),
+        column("status"),
+        column("created_at", DateTime()),
+        column("updated_at", DateTime()),
+    )
+    # (period, bucket_start, shard) -> [wagered_cents, won_cents, games]
+    totals = defaultdict(lambda: [0, 0, 0])
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(games).where(games.c.id > last_id).order_by(games.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            shard = row.user_id % shards
+            for period, start in bucket_starts(row.created_at):
+                bucket = totals[(period.value, start, shard)]
+                bucket[0] += row.bet_cents
+                bucket[2] += 1
+            if row.status == "claimed":
+                for period, start in bucket_starts(row.updated_at or row.created_at):
+                    totals[(period.value, start, shard)][1] += row.prize_cents
+        last_id = rows[-1].id
+
+    if totals:
+        conn.execute(CasinoAggregate.__table__.insert(), [
+            {
+                "period": period,
+                "bucket_start": start,
+                "shard": shard,
+                "wagered_cents": wagered,
+                "won_cents": won,
+                "games": count,
+            }
+            for (period, start, shard), (wagered, won, count) in totals.items()
+        ])
+    logger.info(f"Backfilled {len(totals)} casino aggregate buckets")
+
+@migration("0006_user_game_counters")
+def user_game_counters(op: Operations, conn: Connection) -> None:
+    """Per-user win/loss counters, backfilled from games"""
+    op.add_column("users", Column("won_games", Integer(), nullable=False, server_default="0"))
+    op.add_column("users", Column("lost_games", Integer(), nullable=False, server_default="0"))
+    op.add_column("users", Column("best_multiplier", Float(), nullable=False, server_default="0"))
+    op.add_column("users", Column("biggest_win_cents", BigInteger(), nullable=False, server_default="0"))
+    conn.execute(text("""
+        UPDATE users SET
+            won_games = (SELECT COUNT(*) FROM games WHERE games.user_id = users.id AND games.status = 'claimed'),
+            lost_games = (SELECT COUNT(*) FROM games WHERE games.user_id = users.id AND games.status = 'lost'),
+            best_multiplier = COALESCE((
+                SELECT MAX(current_multiplier) FROM games WHERE games.user_id = users.id AND games.status = 'claimed'
+            ), 0),
+            biggest_win_cents = COALESCE((
+                SELECT MAX(prize_cents) FROM games WHERE games.user_id = users.id AND games.status = 'claimed'
+            ), 0)
+    """))
+
+@migration("0007_games_history_index")
+def games_history_index(op: Operations, conn: Connection) -> None:
+    """Composite index behind keyset-paged game history"""
+    op.create_index("ix_games_user_created_id", "games", ["user_id", "created_at", "id"])
+
+def run_migrations(engine: Engine, fresh: bool = False) -> None:
+    """Apply pending migrations; on a fresh database only record them"""
+    with engine.connect() as lock_conn:
+        if engine.dialect.name == "postgresql":
+            lock_conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        try:
+            with engine.begin() as conn:
+                schema_migrations.create(conn, checkfirst=True)
+                applied = set(conn.execute(select(schema_migrations.c.revision)).scalars())
+
+            for revision, step in MIGRATIONS:
+                if revision in applied:
+                    continue
+                with engine.begin() as conn:
+                    if not fresh:
+                        logger.info(f"Applying migration {revision}")
+                        step(Operations(MigrationContext.configure(conn)), conn)
+                    conn.execute(
+                        schema_migrations.insert().values(revision=revision, applied_at=datetime.utcnow())
+                    )
+        finally:
+            if engine.dialect.name == "postgresql":
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID})
+                lock_conn.commit()
+
+if __name__ == "__main__":
+    from app.database import init_db
+    logging.basicConfig(level=logging.INFO)
+    init_db()
@@ -1,11 +1,32 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, JSON, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Boolean, ForeignKey, JSON, Enum, LargeBinary, DDL, Index, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
+from typing import Dict
 import enum
 
 Base = declarative_base()
 
+class Bitmask(TypeDecorator):
+    """Arbitrary-width integer bitmask stored as little-endian bytes.
+
+    A 10x10 board needs 100 bits, which does not fit BIGINT, and SQLite
+    would silently turn a larger NUMERIC into a float.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(value).to_bytes(max(1, (int(value).bit_length() + 7) // 8), "little")
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return int.from_bytes(value, "little")
+
 class GameStatus(str, enum.Enum):
     ACTIVE = "active"
     WON = "won"
@@ -18,13 +39,20 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, index=True, nullable=False)
     password_hash = Column(String(255), nullable=False)
-    balance = Column(Float, default=1000.0, nullable=False)
-    total_wagered = Column(Float, default=0.0, nullable=False)
-    total_won = Column(Float, default=0.0, nullable=False)
+    # Money is stored in integer cents; the float properties below are for display
+    balance_cents = Column(BigInteger, default=100000, nullable=False)
+    total_wagered_cents = Column(BigInteger, default=0, nullable=False)
+    total_won_cents = Column(BigInteger, default=0, nullable=False)
     total_games = Column(Integer, default=0, nullable=False)
+    # Maintained on game transitions (claim/loss) so stats never scan games
+    won_games = Column(Integer, default=0, nullable=False)
+    lost_games = Column(Integer, default=0, nullable=False)
+    best_multiplier = Column(Float, default=0.0, nullable=False)
+    biggest_win_cents = Column(BigInteger, default=0, nullable=False)
+    version = Column(Integer, default=0, nullable=False)  # Bumped by every wallet update
     referral_count = Column(Integer, default=0, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # leaderboard sync
     is_active = Column(Boolean, default=True, nullable=False)
     
     # Relationships
@@ -35,28 +63,62 @@ class User(Base):
         foreign_keys="ReferralInvite.inviter_id",
         cascade="all, delete-orphan"
     )
+
+    @property
+    def balance(self) -> float:
+        return self.balance_cents / 100
+
+    @property
+    def total_wagered(self) -> float:
+        return self.total_wagered_cents / 100
+
+    @property
+    def total_won(self) -> float:
+        return self.total_won_cents / 100
     
     def __repr__(self):
         return f"<User(id={self.id}, username={self.username}, balance={self.balance})>"
 
 class Game(Base):
     __tablename__ = "games"
+    __table_args__ = (
+        # Keyset paging of a user's history, newest first
+        Index("ix_games_user_created_id", "user_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
-    bet_amount = Column(Float, nullable=False)
-    grid_size = Column(Integer, nullable=False)  # 3, 4, or 5 (3x3, 4x4, 5x5)
+    bet_cents = Column(BigInteger, nullable=False)
+    grid_size = Column(Integer, nullable=False)  # one of GRID_SIZES (3x3 .. 10x10)
     mines_count = Column(Integer, nullable=False)
-    grid_state = Column(JSON, nullable=False)  # Store the mine field
-    revealed_cells = Column(JSON, default={}, nullable=False)  # Store revealed cells: {(row,col): True/False}
+    mine_mask = Column(Bitmask, nullable=True)  # bit (row * grid_size + col) set = mine
+    revealed_mask = Column(Bitmask, nullable=True)  # bit set = cell opened
+    # Pre-bitmask board encoding; only populated on rows not yet migrated
+    legacy_grid_state = Column("grid_state", JSON(none_as_null=True), nullable=True)
+    legacy_revealed_cells = Column("revealed_cells", JSON(none_as_null=True), nullable=True)
     current_multiplier = Column(Float, default=1.0, nullable=False)
     status = Column(String(20), default=GameStatus.ACTIVE, nullable=False)
-    prize_amount = Column(Float, default=0.0, nullable=False)  # Final prize if won/claimed
+    prize_cents = Column(BigInteger, default=0, nullable=False)  # Final prize if won/claimed
+    state_version = Column(Integer, default=0, nullable=False)  # Bumped on every write of the board
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="games")
+
+    @property
+    def bet_amount(self) -> float:
+        return self.bet_cents / 100
+
+    @property
+    def prize_amount(self) -> float:
+        return self.prize_cents / 100
+
+    @property
+    def revealed_cells(self) -> Dict[str, bool]:
+        """Revealed cells as {"r,c": is_mine}, decoded from the bitmasks"""
+        from app.utils.game_engine import GameEngine
+        return GameEngine.revealed_cells(self)
     
     def __repr__(self):
         return f"<Game(id={self.id}, user_id={self.user_id}, status={self.status}, prize={self.prize_amount})>"
@@ -67,7 +129,7 @@ class ReferralInvite(Base):
     id = Column(Integer, primary_key=True, index=True)
     inviter_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     code = Column(String(32), unique=True, index=True, nullable=False)
-    reward_amount = Column(Float, default=500.0, nullable=False)
+    reward_cents = Column(BigInteger, default=50000, nullable=False)
     clicks = Column(Integer, default=0, nullable=False)
     last_clicked_at = Column(DateTime, nullable=True)
     claimed_by_user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
@@ -81,4 +143,96 @@ class ReferralInvite(Base):
     def __repr__(self):
         return f"<ReferralInvite(id={self.id}, inviter_id={self.inviter_id}, code={self.code}, claimed={self.claimed_by_user_id is not None})>"
 
-__all__ = ['Base', 'User', 'Game', 'GameStatus', 'ReferralInvite']
+class GameEventType(str, enum.Enum):
+    CREATED = "created"
+    REVEALED = "revealed"
+    MINE_HIT = "mine_hit"
+    CLAIMED = "claimed"
+
+class GameEvent(Base):
+    """Append-only per-action history of games, for audit and replay.
+
+    Written in batches by app.utils.game_events rather than in the
+    request's transaction.
+    """
+    __tablename__ = "game_events"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    game_id = Column(Integer, ForeignKey("games.id"), nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)
+    event_type = Column(String(20), nullable=False)
+    row = Column(Integer, nullable=True)
+    col = Column(Integer, nullable=True)
+    multiplier = Column(Float, nullable=True)  # after the action
+    amount_cents = Column(BigInteger, nullable=True)  # bet for created, payout for claimed
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<GameEvent(id={self.id}, game_id={self.game_id}, type={self.event_type})>"
+
+class AggregatePeriod(str, enum.Enum):
+    TOTAL = "total"  # all-time, bucket_start is the epoch
+    HOUR = "hour"
+    DAY = "day"
+
+class CasinoAggregate(Base):
+    """Running casino totals per period bucket.
+
+    Each bucket is striped over several shard rows (by user id) so
+    concurrent bets do not queue on one row lock; readers sum the shards.
+    """
+    __tablename__ = "casino_aggregates"
+
+    period = Column(String(8), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    wagered_cents = Column(BigInteger, default=0, nullable=False)
+    won_cents = Column(BigInteger, default=0, nullable=False)
+    games = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<CasinoAggregate(period={self.period}, bucket_start={self.bucket_start}, shard={self.shard})>"
+
+class LedgerEntryType(str, enum.Enum):
+    OPENING_BALANCE = "opening_balance"  # balance carried over from before the ledger existed
+    SIGNUP_BONUS = "signup_bonus"
+    BET = "bet"
+    PAYOUT = "payout"
+
+class LedgerEntry(Base):
+    """Append-only record of every balance change.
+
+    Written in the same transaction as the wallet update it describes;
+    rows are never updated or deleted, so per-user sums always reconcile
+    with users.balance_cents.
+    """
+    __tablename__ = "ledger"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    game_id = Column(Integer, ForeignKey("games.id"), nullable=True, index=True)
+    entry_type = Column(String(20), nullable=False)
+    amount_cents = Column(BigInteger, nullable=False)  # credit > 0, debit < 0
+    balance_after_cents = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<LedgerEntry(id={self.id}, user_id={self.user_id}, type={self.entry_type}, amount={self.amount_cents})>"
+
+# Enforce append-only at the database level where triggers are available
+event.listen(
+    LedgerEntry.__table__,
+    "after_create",
+    DDL("""
+        CREATE OR REPLACE FUNCTION ledger_append_only() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION 'ledger is append-only';
+        END;
+        $$ LANGUAGE plpgsql;
+        CREATE TRIGGER ledger_append_only
+            BEFORE UPDATE OR DELETE ON ledger
+            FOR EACH ROW EXECUTE FUNCTION ledger_append_only();
+    """).execute_if(dialect="postgresql")
+)
+
+__all__ = ['Base', 'Bitmask', 'User', 'Game', 'GameStatus', 'ReferralInvite', 'GameEvent', 'GameEventType', 'CasinoAggregate', 'AggregatePeriod', 'LedgerEntry', 'LedgerEntryType']
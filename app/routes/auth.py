@@ -1,18 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta, datetime
-from app.database import get_db
+from app.database import get_async_db
 from app.schemas import UserCreate, UserLogin, Token, UserResponse
 from app.models import User, ReferralInvite
 from app.utils import (
     get_password_hash, 
     verify_password, 
     create_access_token,
-    verify_token,
-    authenticate_user
+    decode_token,
+    authenticate_user,
+    password_hasher,
+    PasswordHasherBusy,
+    principal_cache,
+    Principal
 )
 from app.utils.logger import log_user_action, log_error
+from app.utils.wallet import record_entry, STARTING_BALANCE_CENTS
+from app.utils.leaderboard import leaderboard, RankedUser
+from app.models import LedgerEntryType
+from app.utils.query_profiler import query_budget
+from app.utils.read_replica import get_read_db
 import logging
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
@@ -27,12 +37,20 @@ def get_client_ip(request: Request) -> str | None:
         return request.client.host
     return None
 
-@router.post("/register", response_model=Token)
+def raise_server_busy(exc: PasswordHasherBusy):
+    """Turn a saturated hash pool into 503 with a Retry-After hint"""
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please retry shortly",
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@router.post("/register", response_model=Token, dependencies=[query_budget(8)])
 async def register(
     user_data: UserCreate,
     request: Request,
     response: Response,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Register new user"""
     try:
@@ -43,9 +61,9 @@ async def register(
             device_id = uuid.uuid4().hex
 
         # Check if user exists
-        existing_user = db.query(User).filter(
-            User.username == user_data.username
-        ).first()
+        existing_user = await db.scalar(
+            select(User).where(User.username == user_data.username)
+        )
         
         if existing_user:
             log_error(
@@ -58,29 +76,40 @@ async def register(
 
         inviter = None
         if user_data.referral_code:
-            inviter = db.query(User).filter(
-                User.username == user_data.referral_code
-            ).first()
+            inviter = await db.scalar(
+                select(User).where(User.username == user_data.referral_code)
+            )
         
         # Create new user
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await password_hasher.hash(user_data.password)
 
         new_user = User(
             username=user_data.username,
             password_hash=hashed_password,
-            balance=1000.0  # Starting balance
+            balance_cents=STARTING_BALANCE_CENTS  # Starting balance
         )
         
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.flush()
+        record_entry(
+            db,
+            new_user.id,
+            LedgerEntryType.SIGNUP_BONUS,
+            STARTING_BALANCE_CENTS,
+            STARTING_BALANCE_CENTS
+        )
 
         if inviter and inviter.id != new_user.id:
-            inviter.referral_count += 1
-            db.commit()
+            await db.execute(
+                update(User)
+                .where(User.id == inviter.id)
+                .values(referral_count=User.referral_count + 1)
+            )
+        await db.commit()
+        leaderboard.upsert(RankedUser.from_row(new_user))
         
         # Create token
-        access_token = create_access_token(data={"sub": new_user.username})
+        access_token = create_access_token(data={"sub": new_user.username, "uid": new_user.id})
         
         log_user_action("user_registration", new_user.id)
         
@@ -100,6 +129,8 @@ async def register(
     
     except HTTPException:
         raise
+    except PasswordHasherBusy as e:
+        raise_server_busy(e)
     except Exception as e:
         logger.exception("Error during registration")
         log_error(str(e), "REGISTRATION_ERROR")
@@ -108,11 +139,11 @@ async def register(
             detail="Registration failed"
         )
 
-@router.post("/login", response_model=Token)
-async def login(credentials: UserLogin, db: Session = Depends(get_db)):
+@router.post("/login", response_model=Token, dependencies=[query_budget(3)])
+async def login(credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Login user"""
     try:
-        user = authenticate_user(db, credentials.username, credentials.password)
+        user = await authenticate_user(db, credentials.username, credentials.password)
         
         if not user:
             log_error(
@@ -132,7 +163,7 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
             )
         
         # Create token
-        access_token = create_access_token(data={"sub": user.username})
+        access_token = create_access_token(data={"sub": user.username, "uid": user.id})
         
         log_user_action("user_login", user.id)
         
@@ -144,6 +175,8 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
     
     except HTTPException:
         raise
+    except PasswordHasherBusy as e:
+        raise_server_busy(e)
     except Exception as e:
         logger.exception("Error during login")
         log_error(str(e), "LOGIN_ERROR")
@@ -152,18 +185,60 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
             detail="Login failed"
         )
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)) -> User:
-    """Get current authenticated user from JWT token"""
-    token = credentials.credentials
-    username = verify_token(token)
-    
-    if not username:
+async def resolve_principal(token: str, db: AsyncSession) -> tuple[Principal, User | None]:
+    """Resolve a bearer token, using the principal cache when possible.
+
+    Returns the principal and, on a cache miss, the User row loaded to
+    build it (None on a hit).
+    """
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal, None
+
+    payload = decode_token(token)
+    if not payload:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token"
         )
-    
-    user = db.query(User).filter(User.username == username).first()
+
+    # Tokens issued before "uid" was added only carry the username
+    if payload.get("uid") is not None:
+        user = await db.get(User, payload["uid"])
+    else:
+        user = await db.scalar(select(User).where(User.username == payload["sub"]))
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found"
+        )
+
+    principal = Principal(id=user.id, username=user.username, is_active=user.is_active)
+    principal_cache.put(token, principal, payload.get("exp"))
+    return principal, user
+
+def ensure_active(principal: Principal) -> None:
+    if not principal.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User account is inactive"
+        )
+
+async def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_async_db)) -> Principal:
+    """Get the authenticated caller without loading the user row.
+
+    For routes that only need the caller's id; a cache hit costs no query.
+    """
+    principal, _ = await resolve_principal(credentials.credentials, db)
+    ensure_active(principal)
+    return principal
+
+async def load_current_user(token: str, db: AsyncSession) -> User:
+    principal, user = await resolve_principal(token, db)
+    ensure_active(principal)
+
+    if user is None:
+        user = await db.get(User, principal.id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -172,8 +247,16 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     
     return user
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_async_db)) -> User:
+    """Get current authenticated user from JWT token"""
+    return await load_current_user(credentials.credentials, db)
+
+async def get_current_user_for_read(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_read_db)) -> User:
+    """get_current_user loaded through get_read_db, for read-only routes"""
+    return await load_current_user(credentials.credentials, db)
+
 @router.post("/logout")
-async def logout(current_user: User = Depends(get_current_user)):
+async def logout(current_user: Principal = Depends(get_current_principal)):
     """Logout user (token invalidation happens client-side)"""
     log_user_action("user_logout", current_user.id)
     return {"message": "Logged out successfully"}
@@ -1,33 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 
-from app.database import get_db
-from app.models import User
+from app.routes.auth import get_current_principal
+from app.utils import Principal
+from app.utils.casino_aggregates import read_totals
+from app.utils.query_profiler import query_budget
+from app.utils.read_replica import read_session
+from app.utils.http_cache import response_cache
+from app.utils.serialization import dumps
 import logging
 
 router = APIRouter(prefix="/api/casino", tags=["casino"])
 logger = logging.getLogger(__name__)
 
-@router.get("/stats")
-async def get_casino_stats(db: Session = Depends(get_db)):
+async def render_casino_stats(hours: Optional[int]) -> bytes:
+    """Casino stats as JSON; shared by concurrent requests for them"""
+    async with read_session() as db:
+        wagered_cents, won_cents, games, since = await read_totals(db, hours)
+    total_wagered = wagered_cents / 100
+    total_won = won_cents / 100
+    casino_profit = total_wagered - total_won
+    edge_pct = (casino_profit / total_wagered * 100.0) if total_wagered > 0 else 0.0
+
+    stats = {
+        "total_wagered": round(total_wagered, 2),
+        "total_won": round(total_won, 2),
+        "casino_profit": round(casino_profit, 2),
+        "casino_edge_percent": round(edge_pct, 2),
+        "total_games": games,
+        "since": since,
+    }
+    return dumps(stats)
+
+@router.get("/stats", dependencies=[query_budget(2)])
+async def get_casino_stats(
+    request: Request,
+    hours: Optional[int] = Query(None, ge=1, le=24 * 366),
+    current_user: Principal = Depends(get_current_principal)
+):
     """Return aggregate casino edge statistics.
 
     Casino profit is defined as the total amount wagered by all users
-    minus the total amount paid out in winnings.
+    minus the total amount paid out in winnings. With ``hours`` only
+    activity in that recent window is counted.
     """
     try:
-        total_wagered = db.query(func.coalesce(func.sum(User.total_wagered), 0.0)).scalar() or 0.0
-        total_won = db.query(func.coalesce(func.sum(User.total_won), 0.0)).scalar() or 0.0
-        casino_profit = total_wagered - total_won
-        edge_pct = (casino_profit / total_wagered * 100.0) if total_wagered > 0 else 0.0
-
-        return {
-            "total_wagered": round(total_wagered, 2),
-            "total_won": round(total_won, 2),
-            "casino_profit": round(casino_profit, 2),
-            "casino_edge_percent": round(edge_pct, 2),
-        }
+        cached = await response_cache.get_or_build(("casino_stats", hours), lambda: render_casino_stats(hours))
+        return cached.respond(request, response_cache.cache_control)
     except Exception:
         logger.exception("Error computing casino stats")
         raise HTTPException(
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException, Query, status
+from app.database import get_settings
+from app.utils.query_profiler import recent_profiles, recent_slow_queries
+
+router = APIRouter(prefix="/api/debug", tags=["debug"])
+
+@router.get("/queries")
+async def get_query_profiles(limit: int = Query(50, ge=1, le=200)):
+    """Recent per-request query profiles and slow statements (QUERY_DEBUG only)"""
+    if not get_settings().query_debug:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not Found"
+        )
+    return {
+        "requests": list(recent_profiles)[-limit:],
+        "slow_queries": list(recent_slow_queries),
+    }
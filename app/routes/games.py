@@ -1,78 +1,255 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from app.database import get_db
-from app.schemas import GameCreate, CellClick, GameState, GameResult, GameHistory
-from app.models import User, Game, GameStatus
-from app.routes.auth import get_current_user
-from app.utils import GameEngine
+from app.database import get_async_db
+from app.schemas import GameCreate, CellClick, CellBatch, GameState, CompactGameState, GameResult, GameHistory, GameConfig, MultiplierTable
+from app.models import User, Game, GameStatus, GameEventType
+from app.routes.auth import get_current_principal
+from app.utils import GameEngine, Principal
+from app.utils.game_cache import game_cache, GameStateConflict
+from app.utils.wallet import debit_bet, credit_payout, record_loss, to_cents, InsufficientFunds
+from app.utils.leaderboard import leaderboard
+from app.utils.game_history import history_page, export_ndjson, export_csv
+from app.utils.game_events import game_events
 from app.utils.logger import log_game_action, log_error
+from app.utils.query_profiler import query_budget
+from app.utils.read_replica import get_read_db
+from app.utils.http_cache import etag_matches, not_modified, make_etag, REVALIDATE, IMMUTABLE
+from app.utils.serialization import COMPACT_JSON, accepts, fields, json_response, rows
 import logging
 
 router = APIRouter(prefix="/api/games", tags=["games"])
 logger = logging.getLogger(__name__)
 
-@router.post("/new", response_model=GameState)
-async def create_new_game(
-    game_data: GameCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Create new mine game"""
+def raise_game_conflict():
+    """Another process wrote this game since it was cached here"""
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Game was updated elsewhere, please reload it"
+    )
+
+def game_state(game: Game, compact: bool) -> dict:
+    """Response fields of ``game``, with the board as bitmasks if ``compact``"""
+    if compact:
+        revealed, mines = GameEngine.compact_board(game)
+        return fields(CompactGameState, game, revealed=revealed, mines=mines)
+    return fields(GameState, game)
+
+def game_response(content: dict, compact: bool, headers: Optional[Dict[str, str]] = None):
+    """Response carrying game state in the representation the client accepts"""
+    return json_response(
+        content,
+        headers={**(headers or {}), "Vary": "Accept"},
+        media_type=COMPACT_JSON if compact else None
+    )
+
+async def start_game(db: AsyncSession, user_id: int, game_data: GameCreate) -> Game:
+    """Take the bet and create a game, cached for the following clicks"""
+    # Validate game parameters
+    if not GameEngine.validate_game_params(game_data.grid_size, game_data.mines_count):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid grid size or mines count"
+        )
+    
+    bet_cents = to_cents(game_data.bet_amount)
+    if bet_cents <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid bet amount"
+        )
+    
+    # Create mine field
+    grid, mine_mask = GameEngine.create_minefield(game_data.grid_size, game_data.mines_count)
+    
+    # Create game record
+    new_game = Game(
+        user_id=user_id,
+        bet_cents=bet_cents,
+        grid_size=game_data.grid_size,
+        mines_count=game_data.mines_count,
+        mine_mask=mine_mask,
+        revealed_mask=0,
+        current_multiplier=1.0,
+        status=GameStatus.ACTIVE,
+        prize_cents=bet_cents
+    )
+    
+    db.add(new_game)
+    await db.flush()
+    
+    # Take the bet in the same transaction; the conditional UPDATE
+    # fails instead of overdrawing when the balance is short
     try:
-        # Validate game parameters
-        if not GameEngine.validate_game_params(game_data.grid_size, game_data.mines_count):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid grid size or mines count"
-            )
-        
-        # Check if user has enough balance
-        if current_user.balance < game_data.bet_amount:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Insufficient balance for this bet"
-            )
-        
-        # Create mine field
-        grid, grid_dict = GameEngine.create_minefield(game_data.grid_size, game_data.mines_count)
-        
-        # Create game record
-        new_game = Game(
-            user_id=current_user.id,
-            bet_amount=game_data.bet_amount,
-            grid_size=game_data.grid_size,
-            mines_count=game_data.mines_count,
-            grid_state=json.dumps(grid_dict),
-            revealed_cells={},
-            current_multiplier=1.0,
-            status=GameStatus.ACTIVE,
-            prize_amount=game_data.bet_amount
+        wallet = await debit_bet(db, user_id, bet_cents, new_game.id)
+    except InsufficientFunds:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Insufficient balance for this bet"
         )
-        
-        db.add(new_game)
-        db.commit()
-        db.refresh(new_game)
-        
-        # Update user stats
-        current_user.total_games += 1
-        current_user.total_wagered += game_data.bet_amount
-        current_user.balance -= game_data.bet_amount
-        db.commit()
-        
+    await db.commit()
+    leaderboard.record(wallet)
+
+    # Serve the following clicks from memory
+    db.expunge(new_game)
+    game_cache.put(new_game)
+    await game_events.record(new_game.id, user_id, GameEventType.CREATED, amount_cents=bet_cents)
+    
+    log_game_action(
+        "game_started",
+        user_id,
+        new_game.id,
+        {
+            'bet_amount': game_data.bet_amount,
+            'grid_size': game_data.grid_size,
+            'mines_count': game_data.mines_count
+        }
+    )
+    return new_game
+
+async def load_active_game(db: AsyncSession, game_id: int, user_id: int) -> Game:
+    """The caller's game, which must still be in play"""
+    game = await game_cache.get(db, game_id)
+    if not game:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Game not found"
+        )
+    
+    # Check ownership
+    if game.user_id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not your game"
+        )
+    
+    # Check game status
+    if game.status != GameStatus.ACTIVE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Game is {game.status}"
+        )
+    return game
+
+async def save_move(db: AsyncSession, game: Game, user_id: int) -> None:
+    """Terminal states are written now; safe moves are written back by the cache"""
+    if game.status == GameStatus.ACTIVE:
+        await game_cache.record_change(db, game)
+        return
+    try:
+        await game_cache.persist(db, game)
+        await record_loss(db, user_id)
+        await db.commit()
+    finally:
+        game_cache.evict(game.id)
+
+async def record_move_events(game: Game, cells: List[Tuple[int, int]], result: Dict) -> None:
+    """One event per opened cell, with the multiplier reached after it"""
+    opened = cells[:result['revealed']]
+    safe = opened[:-1] if result['hit_mine'] else opened
+    safe_before = result['safe_clicks'] - len(safe)
+    for i, (row, col) in enumerate(safe, 1):
+        await game_events.record(
+            game.id, game.user_id, GameEventType.REVEALED, row, col,
+            multiplier=GameEngine.get_multiplier(game.grid_size, game.mines_count, safe_before + i)
+        )
+    if result['hit_mine']:
+        row, col = opened[-1]
+        await game_events.record(game.id, game.user_id, GameEventType.MINE_HIT, row, col)
+
+async def play_cells(db: AsyncSession, game_id: int, user_id: int, cells: List[Tuple[int, int]]) -> Tuple[Game, Dict]:
+    """Reveal cells in order and save the move; returns the engine result"""
+    game = await load_active_game(db, game_id, user_id)
+    
+    result = GameEngine.reveal_cells(game, cells)
+    
+    if result.get('error'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=result['message']
+        )
+    
+    await save_move(db, game, user_id)
+    await record_move_events(game, cells, result)
+    
+    if len(cells) == 1:
         log_game_action(
-            "game_started",
-            current_user.id,
-            new_game.id,
+            "cell_clicked",
+            user_id,
+            game_id,
             {
-                'bet_amount': game_data.bet_amount,
-                'grid_size': game_data.grid_size,
-                'mines_count': game_data.mines_count
+                'row': cells[0][0],
+                'col': cells[0][1],
+                'hit_mine': result['hit_mine'],
+                'multiplier': result['multiplier']
             }
         )
-        
-        return GameState.model_validate(new_game)
+    else:
+        log_game_action(
+            "cells_revealed",
+            user_id,
+            game_id,
+            {
+                'requested': len(cells),
+                'revealed': result['revealed'],
+                'hit_mine': result['hit_mine'],
+                'multiplier': result['multiplier']
+            }
+        )
+    return game, result
+
+async def claim_game(db: AsyncSession, game_id: int, user_id: int) -> Game:
+    """End an active game and pay out its current prize"""
+    game = await load_active_game(db, game_id, user_id)
+    
+    # Reveal full board so frontend can show final state
+    GameEngine.reveal_board(game)
+
+    # Claim prize
+    game.status = GameStatus.CLAIMED
+
+    # The versioned game update makes a second claim (here or on another
+    # replica) fail, and the payout commits together with it
+    try:
+        await game_cache.persist(db, game)
+        wallet = await credit_payout(
+            db, user_id, game.prize_cents, game_id, game.current_multiplier
+        )
+        await db.commit()
+    finally:
+        game_cache.evict(game_id)
+    leaderboard.record(wallet)
+    await game_events.record(
+        game_id, user_id, GameEventType.CLAIMED,
+        multiplier=game.current_multiplier, amount_cents=game.prize_cents
+    )
+    
+    log_game_action(
+        "prize_claimed",
+        user_id,
+        game_id,
+        {
+            'prize_amount': game.prize_amount,
+            'multiplier': game.current_multiplier
+        }
+    )
+    return game
+
+@router.post("/new", response_model=GameState, dependencies=[query_budget(6)])
+async def create_new_game(
+    game_data: GameCreate,
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create new mine game"""
+    try:
+        new_game = await start_game(db, current_user.id, game_data)
+        compact = accepts(request, COMPACT_JSON)
+        return game_response(game_state(new_game, compact), compact)
     
     except HTTPException:
         raise
@@ -84,71 +261,33 @@ async def create_new_game(
             detail="Failed to create game"
         )
 
-@router.post("/{game_id}/click", response_model=GameResult)
+@router.post("/{game_id}/click", response_model=GameResult, response_model_exclude_none=True, dependencies=[query_budget(5)])
 async def click_cell(
     game_id: int,
     click_data: CellClick,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    include_state: bool = False,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Click on a mine field cell"""
     try:
-        # Get game
-        game = db.query(Game).filter(Game.id == game_id).first()
-        if not game:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Game not found"
-            )
+        game, result = await play_cells(db, game_id, current_user.id, [(click_data.row, click_data.col)])
         
-        # Check ownership
-        if game.user_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not your game"
-            )
-        
-        # Check game status
-        if game.status != GameStatus.ACTIVE:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Game is {game.status}"
-            )
-        
-        # Process click
-        result = GameEngine.process_click(game, click_data.row, click_data.col)
-        
-        if result.get('error'):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=result['message']
-            )
-        
-        # Update game
-        db.commit()
-        db.refresh(game)
-        
-        log_game_action(
-            "cell_clicked",
-            current_user.id,
-            game_id,
-            {
-                'row': click_data.row,
-                'col': click_data.col,
-                'hit_mine': result['hit_mine'],
-                'multiplier': result['multiplier']
-            }
-        )
-        
-        return GameResult(
+        compact = accepts(request, COMPACT_JSON)
+        return game_response(fields(
+            GameResult,
+            game,
+            exclude_none=True,
             game_id=game_id,
-            status=game.status,
-            prize_amount=game.prize_amount,
-            message=result['message']
-        )
+            message=result['message'],
+            game=game_state(game, compact) if include_state else None
+        ), compact)
     
     except HTTPException:
         raise
+    except GameStateConflict:
+        raise_game_conflict()
     except Exception as e:
         logger.exception("Error processing click")
         log_error(str(e), "CLICK_ERROR", current_user.id, {'game_id': game_id})
@@ -157,77 +296,66 @@ async def click_cell(
             detail="Failed to process click"
         )
 
-@router.post("/{game_id}/claim", response_model=GameResult)
-async def claim_prize(
+@router.post("/{game_id}/reveal", response_model=GameResult, response_model_exclude_none=True, dependencies=[query_budget(5)])
+async def reveal_cells(
     game_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    batch: CellBatch,
+    request: Request,
+    include_state: bool = False,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Claim prize and end game"""
+    """Reveal several cells in order, stopping at the first mine"""
     try:
-        # Get game
-        game = db.query(Game).filter(Game.id == game_id).first()
-        if not game:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Game not found"
-            )
-        
-        # Check ownership
-        if game.user_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not your game"
-            )
-        
-        # Check game status
-        if game.status != GameStatus.ACTIVE:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Game is already {game.status}"
-            )
-        
-        # Reveal full board so frontend can show final state
-        import json
-        grid = json.loads(game.grid_state) if isinstance(game.grid_state, str) else game.grid_state
-        revealed_cells = game.revealed_cells.copy() if isinstance(game.revealed_cells, dict) else {}
-        for r in range(game.grid_size):
-            for c in range(game.grid_size):
-                key = f"{r},{c}"
-                if key not in revealed_cells:
-                    cell_is_mine = bool(grid[str(r)].get(str(c), 0))
-                    revealed_cells[key] = cell_is_mine
-        game.revealed_cells = revealed_cells
-
-        # Claim prize
-        game.status = GameStatus.CLAIMED
-
-        # Update user balance and stats
-        current_user.balance += game.prize_amount
-        current_user.total_won += game.prize_amount
-        
-        db.commit()
-        db.refresh(game)
+        game, result = await play_cells(
+            db, game_id, current_user.id, [(cell.row, cell.col) for cell in batch.cells]
+        )
         
-        log_game_action(
-            "prize_claimed",
-            current_user.id,
-            game_id,
-            {
-                'prize_amount': game.prize_amount,
-                'multiplier': game.current_multiplier
-            }
+        compact = accepts(request, COMPACT_JSON)
+        return game_response(fields(
+            GameResult,
+            game,
+            exclude_none=True,
+            game_id=game_id,
+            message=result['message'],
+            revealed=result['revealed'],
+            game=game_state(game, compact) if include_state else None
+        ), compact)
+    
+    except HTTPException:
+        raise
+    except GameStateConflict:
+        raise_game_conflict()
+    except Exception as e:
+        logger.exception("Error revealing cells")
+        log_error(str(e), "REVEAL_ERROR", current_user.id, {'game_id': game_id})
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to reveal cells"
         )
+
+@router.post("/{game_id}/claim", response_model=GameResult, response_model_exclude_none=True, dependencies=[query_budget(6)])
+async def claim_prize(
+    game_id: int,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Claim prize and end game"""
+    try:
+        game = await claim_game(db, game_id, current_user.id)
         
-        return GameResult(
+        return json_response(fields(
+            GameResult,
+            game,
+            exclude_none=True,
             game_id=game_id,
-            status=game.status,
-            prize_amount=game.prize_amount,
             message=f"Prize claimed! Won ${game.prize_amount:.2f}"
-        )
+        ))
     
     except HTTPException:
         raise
+    except GameStateConflict:
+        raise_game_conflict()
     except Exception as e:
         logger.exception("Error claiming prize")
         log_error(str(e), "CLAIM_ERROR", current_user.id, {'game_id': game_id})
@@ -236,15 +364,43 @@ async def claim_prize(
             detail="Failed to claim prize"
         )
 
-@router.get("/{game_id}", response_model=GameState)
+@router.get("/multipliers", response_model=GameConfig)
+async def get_multipliers(grid_size: Optional[int] = None, mines_count: Optional[int] = None):
+    """Get payout multiplier tables for the configured board sizes"""
+    grid_sizes = GameEngine.allowed_grid_sizes()
+    if grid_size is not None and grid_size not in grid_sizes:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid grid size"
+        )
+
+    tables = []
+    for size in ([grid_size] if grid_size is not None else grid_sizes):
+        for mines in range(1, size * size):
+            if mines_count is not None and mines != mines_count:
+                continue
+            tables.append(MultiplierTable(
+                grid_size=size,
+                mines_count=mines,
+                multipliers=list(GameEngine.multiplier_table(size, mines))
+            ))
+
+    return GameConfig(
+        grid_sizes=list(grid_sizes),
+        house_edge=GameEngine.HOUSE_EDGE,
+        tables=tables
+    )
+
+@router.get("/{game_id}", response_model=GameState, dependencies=[query_budget(2)])
 async def get_game(
     game_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get game state"""
     try:
-        game = db.query(Game).filter(Game.id == game_id).first()
+        game = game_cache.peek(game_id) or await db.get(Game, game_id)
         if not game:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -257,7 +413,19 @@ async def get_game(
                 detail="Not your game"
             )
         
-        return GameState.model_validate(game)
+        # Finished boards never change again; active ones change with every move
+        cache_control = REVALIDATE if game.status == GameStatus.ACTIVE else IMMUTABLE
+        compact = accepts(request, COMPACT_JSON)
+        etag = make_etag("game", game.id, game.status, game.state_version, game.revealed_mask, compact)
+        if etag_matches(request, etag):
+            response = not_modified(etag, cache_control)
+            response.headers["Vary"] = "Accept"
+            return response
+        return game_response(
+            game_state(game, compact),
+            compact,
+            headers={"ETag": etag, "Cache-Control": cache_control}
+        )
     
     except HTTPException:
         raise
@@ -268,24 +436,51 @@ async def get_game(
             detail="Failed to get game"
         )
 
-@router.get("/user/history", response_model=list[GameHistory])
+@router.get("/user/history", response_model=list[GameHistory], dependencies=[query_budget(2)])
 async def get_game_history(
-    skip: int = 0,
-    limit: int = 20,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get user's game history"""
+    """Get user's game history; follow X-Next-Cursor for older games"""
     try:
-        games = db.query(Game).filter(
-            Game.user_id == current_user.id
-        ).order_by(Game.created_at.desc()).offset(skip).limit(limit).all()
-        
-        return [GameHistory.model_validate(game) for game in games]
+        try:
+            games, next_cursor = await history_page(db, current_user.id, limit, cursor, skip)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        return json_response(
+            rows(GameHistory, games),
+            headers={"X-Next-Cursor": next_cursor} if next_cursor else None
+        )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error getting game history")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to get game history"
         )
+
+@router.get("/user/history/export")
+async def export_game_history(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Stream the user's full game history as NDJSON or CSV"""
+    if format == "csv":
+        return StreamingResponse(
+            export_csv(db, current_user.id),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="game-history.csv"'}
+        )
+    return StreamingResponse(
+        export_ndjson(db, current_user.id),
+        media_type="application/x-ndjson"
+    )
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 import logging
 
-from app.database import get_db
+from app.database import get_async_db
 from app.routes.auth import get_current_user
 from app.models import User
 from app.schemas import ReferralLink
@@ -16,7 +17,7 @@ logger = logging.getLogger(__name__)
 async def create_referral_link(
     request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Return a referral link for the current user (code = username)"""
     try:
@@ -42,10 +43,10 @@ async def create_referral_link(
 
 
 @router.get("/track")
-async def track_referral_click(code: str, db: Session = Depends(get_db)):
+async def track_referral_click(code: str, db: AsyncSession = Depends(get_async_db)):
     """Track referral link clicks (no-op, code = username)"""
     try:
-        user = db.query(User).filter(User.username == code).first()
+        user = await db.scalar(select(User).where(User.username == code))
         if user:
             return {"status": "tracked"}
         return {"status": "ignored"}
@@ -1,20 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from app.database import get_db
-from app.schemas import UserProfile, Leaderboard, UserStats, GameHistory
-from app.models import User, Game, GameStatus
-from app.routes.auth import get_current_user
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.schemas import UserProfile, Leaderboard, UserStats, UserRank, GameHistory
+from app.models import User
+from app.routes.auth import get_current_user, get_current_user_for_read, get_current_principal
+from app.utils import Principal
+from app.utils.leaderboard import leaderboard, encode_cursor, RankedUser
+from app.utils.game_history import history_page
+from app.utils.query_profiler import query_budget
+from app.utils.read_replica import get_read_db, read_session
+from app.utils.http_cache import response_cache, conditional, make_etag
+from app.utils.serialization import dumps, fields, json_response, rows
 import logging
 
 router = APIRouter(prefix="/api/user", tags=["user"])
 logger = logging.getLogger(__name__)
 
-@router.get("/profile", response_model=UserProfile)
-async def get_profile(current_user: User = Depends(get_current_user)):
+def ranked_stats(rank: int, entry: RankedUser) -> dict:
+    wagered = entry.total_wagered_cents
+    win_rate = (entry.total_won_cents / wagered * 100) if wagered > 0 else 0
+    return dict(
+        rank=rank,
+        username=entry.username,
+        total_games=entry.total_games,
+        total_wagered=wagered / 100,
+        total_won=entry.total_won_cents / 100,
+        win_rate=round(win_rate, 2),
+        balance=entry.balance_cents / 100,
+        created_at=entry.created_at
+    )
+
+@router.get("/profile", response_model=UserProfile, dependencies=[query_budget(2)])
+async def get_profile(request: Request, response: Response, current_user: User = Depends(get_current_user)):
     """Get current user profile"""
     try:
-        return UserProfile.model_validate(current_user)
+        etag = make_etag("profile", current_user.id, current_user.version, current_user.updated_at)
+        return conditional(request, response, etag) or UserProfile.model_validate(current_user)
     except Exception as e:
         logger.exception("Error getting profile")
         raise HTTPException(
@@ -22,20 +43,29 @@ async def get_profile(current_user: User = Depends(get_current_user)):
             detail="Failed to get profile"
         )
 
-@router.get("/history", response_model=list[GameHistory])
+@router.get("/history", response_model=list[GameHistory], dependencies=[query_budget(2)])
 async def get_history(
-    skip: int = 0,
-    limit: int = 20,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get user's game history"""
+    """Get user's game history; follow X-Next-Cursor for older games"""
     try:
-        games = db.query(Game).filter(
-            Game.user_id == current_user.id
-        ).order_by(Game.created_at.desc()).offset(skip).limit(limit).all()
-        
-        return [GameHistory.model_validate(game) for game in games]
+        try:
+            games, next_cursor = await history_page(db, current_user.id, limit, cursor, skip)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        return json_response(
+            rows(GameHistory, games),
+            headers={"X-Next-Cursor": next_cursor} if next_cursor else None
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error getting history")
         raise HTTPException(
@@ -43,37 +73,42 @@ async def get_history(
             detail="Failed to get history"
         )
 
-@router.get("/leaderboard", response_model=Leaderboard)
+async def render_leaderboard(limit: int, cursor: Optional[str]) -> bytes:
+    """One leaderboard page as JSON; shared by concurrent requests for it"""
+    async with read_session() as db:
+        await leaderboard.sync(db)
+    try:
+        page = leaderboard.top(limit, cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    
+    # ranked_stats yields exactly the UserStats fields, from our own index
+    return dumps(fields(
+        Leaderboard,
+        None,
+        users=[ranked_stats(rank, entry) for rank, entry in page],
+        total_users=len(leaderboard),
+        next_cursor=encode_cursor(page[-1][1]) if len(page) == limit else None
+    ))
+
+@router.get("/leaderboard", response_model=Leaderboard, dependencies=[query_budget(2)])
 async def get_leaderboard(
-    limit: int = 100,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal)
 ):
-    """Get global leaderboard"""
+    """Get global leaderboard, one page at a time"""
     try:
-        users = db.query(User).filter(User.is_active == True).order_by(
-            desc(User.total_won)
-        ).limit(limit).all()
-        
-        user_stats = []
-        for rank, user in enumerate(users, 1):
-            win_rate = (user.total_won / user.total_wagered * 100) if user.total_wagered > 0 else 0
-            stats = UserStats(
-                rank=rank,
-                username=user.username,
-                total_games=user.total_games,
-                total_wagered=user.total_wagered,
-                total_won=user.total_won,
-                win_rate=round(win_rate, 2),
-                balance=user.balance,
-                created_at=user.created_at
-            )
-            user_stats.append(stats)
-        
-        return Leaderboard(
-            users=user_stats,
-            total_users=len(users)
+        cached = await response_cache.get_or_build(
+            ("leaderboard", limit, cursor), lambda: render_leaderboard(limit, cursor)
         )
+        return cached.respond(request, response_cache.cache_control)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error getting leaderboard")
         raise HTTPException(
@@ -81,15 +116,42 @@ async def get_leaderboard(
             detail="Failed to get leaderboard"
         )
 
-@router.get("/stats", response_model=dict)
-async def get_stats(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Get detailed user stats"""
+@router.get("/rank", response_model=UserRank, dependencies=[query_budget(2)])
+async def get_my_rank(
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get the current user's leaderboard position"""
     try:
-        # Get user's games
-        games = db.query(Game).filter(Game.user_id == current_user.id).all()
+        await leaderboard.sync(db)
+        ranked = leaderboard.rank(current_user.id)
+        if ranked is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User is not ranked yet"
+            )
         
-        won_games = len([g for g in games if g.status == GameStatus.CLAIMED])
-        lost_games = len([g for g in games if g.status == GameStatus.LOST])
+        return json_response({**ranked_stats(*ranked), "total_users": len(leaderboard)})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error getting rank")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get rank"
+        )
+
+@router.get("/stats", response_model=dict, dependencies=[query_budget(2)])
+async def get_stats(request: Request, response: Response, current_user: User = Depends(get_current_user_for_read)):
+    """Get detailed user stats"""
+    try:
+        not_modified = conditional(
+            request, response, make_etag("stats", current_user.id, current_user.version, current_user.updated_at)
+        )
+        if not_modified:
+            return not_modified
+        won_games = current_user.won_games
+        lost_games = current_user.lost_games
         
         win_rate = (won_games / current_user.total_games * 100) if current_user.total_games > 0 else 0
         roi = ((current_user.total_won - current_user.total_wagered) / current_user.total_wagered * 100) if current_user.total_wagered > 0 else 0
@@ -100,6 +162,9 @@ async def get_stats(current_user: User = Depends(get_current_user), db: Session
             "total_games": current_user.total_games,
             "won_games": won_games,
             "lost_games": lost_games,
+            "active_games": current_user.total_games - won_games - lost_games,
+            "best_multiplier": current_user.best_multiplier,
+            "biggest_win": current_user.biggest_win_cents / 100,
             "total_wagered": current_user.total_wagered,
             "total_won": current_user.total_won,
             "win_rate": round(win_rate, 2),
@@ -0,0 +1,181 @@
+"""WebSocket channel for playing over one authenticated connection.
+
+Connect to ``/ws/game?token=<jwt>``. The token is verified once when the
+socket opens (only its expiry is re-checked per message), and every
+message then runs the same game functions as the REST routes in its own
+short transaction.
+
+Client messages (JSON; an optional "ref" is echoed in the reply):
+  {"type": "new_game", "bet_amount": 10, "grid_size": 5, "mines_count": 3}
+  {"type": "click", "row": 0, "col": 1}
+  {"type": "reveal", "cells": [{"row": 0, "col": 1}, ...]}
+  {"type": "claim"}
+  {"type": "ping"}
+click/reveal/claim act on the game bound to the connection (the last
+one started) unless a "game_id" is given.
+
+Server messages:
+  {"type": "game", "game": {...GameState}}
+  {"type": "delta", "game_id", "status", "current_multiplier",
+   "prize_amount", "cells": {"r,c": is_mine}, "message"}
+  {"type": "error", "status": 400, "detail": "..."}
+  {"type": "pong"}
+A delta only lists cells opened since the last message about that game.
+"""
+import json
+import time
+from typing import Optional
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import create_async_session, get_settings
+from app.models import Game
+from app.routes.auth import resolve_principal, ensure_active
+from app.routes.games import start_game, play_cells, claim_game
+from app.schemas import GameCreate, CellClick, CellBatch, GameState
+from app.utils import GameEngine, Principal, decode_token
+from app.utils.game_cache import GameStateConflict
+from app.utils.read_replica import replica_monitor, read_after_write_cookie
+import logging
+
+router = APIRouter(prefix="/ws", tags=["websocket"])
+logger = logging.getLogger(__name__)
+
+def error_message(status_code: int, detail) -> dict:
+    return {"type": "error", "status": status_code, "detail": detail}
+
+class GameChannel:
+    """Per-connection state: the caller and the game bound to the socket"""
+
+    def __init__(self, principal: Principal):
+        self.principal = principal
+        self.game_id: Optional[int] = None
+        self.known_mask = 0  # cells of the bound game already sent
+
+    def delta(self, game: Game, message: str) -> dict:
+        if game.id != self.game_id:
+            self.game_id, self.known_mask = game.id, 0
+        mine_mask, revealed_mask = GameEngine.board_masks(game)
+        cells = GameEngine.mask_cells(game.grid_size, mine_mask, revealed_mask & ~self.known_mask)
+        self.known_mask = revealed_mask
+        return {
+            "type": "delta",
+            "game_id": game.id,
+            "status": game.status,
+            "current_multiplier": game.current_multiplier,
+            "prize_amount": game.prize_amount,
+            "cells": cells,
+            "message": message,
+        }
+
+    def target_game(self, message: dict) -> int:
+        game_id = message.get("game_id", self.game_id)
+        if game_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No game in progress"
+            )
+        try:
+            return int(game_id)
+        except (TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid game_id"
+            )
+
+    async def new_game(self, db: AsyncSession, message: dict) -> dict:
+        game = await start_game(db, self.principal.id, GameCreate.model_validate(message))
+        self.game_id, self.known_mask = game.id, 0
+        return {"type": "game", "game": GameState.model_validate(game).model_dump(mode="json")}
+
+    async def click(self, db: AsyncSession, message: dict) -> dict:
+        cell = CellClick.model_validate(message)
+        game, result = await play_cells(db, self.target_game(message), self.principal.id, [(cell.row, cell.col)])
+        return self.delta(game, result['message'])
+
+    async def reveal(self, db: AsyncSession, message: dict) -> dict:
+        batch = CellBatch.model_validate(message)
+        game, result = await play_cells(
+            db, self.target_game(message), self.principal.id, [(cell.row, cell.col) for cell in batch.cells]
+        )
+        return self.delta(game, result['message'])
+
+    async def claim(self, db: AsyncSession, message: dict) -> dict:
+        game = await claim_game(db, self.target_game(message), self.principal.id)
+        return self.delta(game, f"Prize claimed! Won ${game.prize_amount:.2f}")
+
+    async def handle(self, message: dict) -> dict:
+        kind = message.get("type")
+        if kind == "ping":
+            return {"type": "pong"}
+        handler = {
+            "new_game": self.new_game,
+            "click": self.click,
+            "reveal": self.reveal,
+            "claim": self.claim,
+        }.get(kind)
+        if handler is None:
+            return error_message(status.HTTP_400_BAD_REQUEST, f"Unknown message type: {kind}")
+
+        db = create_async_session()
+        try:
+            return await handler(db, message)
+        except ValidationError as e:
+            return error_message(status.HTTP_422_UNPROCESSABLE_ENTITY, json.loads(e.json(include_url=False)))
+        except HTTPException as e:
+            return error_message(e.status_code, e.detail)
+        except GameStateConflict:
+            return error_message(status.HTTP_409_CONFLICT, "Game was updated elsewhere, please reload it")
+        except Exception:
+            logger.exception(f"Error handling websocket message {kind}")
+            return error_message(status.HTTP_500_INTERNAL_SERVER_ERROR, "Failed to process message")
+        finally:
+            await db.close()
+
+@router.websocket("/game")
+async def game_channel(websocket: WebSocket, token: str = ""):
+    """Authenticate once, then play games over JSON messages"""
+    payload = decode_token(token) if token else None
+    if not payload:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid token")
+        return
+
+    db = create_async_session()
+    try:
+        principal, _ = await resolve_principal(token, db)
+        ensure_active(principal)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return
+    finally:
+        await db.close()
+
+    expires_at = payload.get("exp")
+    headers = []
+    if replica_monitor.enabled:
+        # Moves on this socket are writes the client's REST reads must see
+        until = max(expires_at or 0, time.time()) + get_settings().read_after_write_seconds
+        headers.append((b"set-cookie", read_after_write_cookie(until)))
+    await websocket.accept(headers=headers)
+    channel = GameChannel(principal)
+    try:
+        while True:
+            text = await websocket.receive_text()
+            if expires_at is not None and time.time() >= expires_at:
+                await websocket.send_json(error_message(status.HTTP_401_UNAUTHORIZED, "Token expired"))
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Token expired")
+                return
+            try:
+                message = json.loads(text)
+                if not isinstance(message, dict):
+                    raise ValueError("expected an object")
+            except ValueError:
+                await websocket.send_json(error_message(status.HTTP_400_BAD_REQUEST, "Messages must be JSON objects"))
+                continue
+
+            reply = await channel.handle(message)
+            if "ref" in message:
+                reply["ref"] = message["ref"]
+            await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
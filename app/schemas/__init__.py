@@ -32,13 +32,16 @@ class UserProfile(UserResponse):
 # Game Schemas
 class GameCreate(BaseModel):
     bet_amount: float = Field(..., gt=0, le=10000)
-    grid_size: int = Field(..., ge=3, le=5)  # 3, 4, or 5
+    grid_size: int = Field(..., ge=2, le=10)  # must also be enabled in GRID_SIZES
     mines_count: int = Field(..., ge=1)
 
 class CellClick(BaseModel):
     row: int = Field(..., ge=0)
     col: int = Field(..., ge=0)
 
+class CellBatch(BaseModel):
+    cells: List[CellClick] = Field(..., min_length=1, max_length=100)  # revealed in order
+
 class GameState(BaseModel):
     id: int
     user_id: int
@@ -56,11 +59,41 @@ class GameState(BaseModel):
     class Config:
         from_attributes = True
 
+class CompactGameState(BaseModel):
+    """GameState with the board as hex bitmasks, bit (row * grid_size + col).
+
+    ``mines`` only has bits for revealed cells, like revealed_cells.
+    """
+    id: int
+    user_id: int
+    bet_amount: float
+    grid_size: int
+    mines_count: int
+    status: str
+    current_multiplier: float
+    prize_amount: float
+    revealed: str
+    mines: str
+    created_at: datetime
+    updated_at: datetime
+
 class GameResult(BaseModel):
     game_id: int
     status: str
     prize_amount: float
     message: str
+    revealed: Optional[int] = None  # cells opened by a batch reveal
+    game: Optional[GameState] = None  # full state when include_state=true
+
+class MultiplierTable(BaseModel):
+    grid_size: int
+    mines_count: int
+    multipliers: List[float]  # index = number of safe clicks
+
+class GameConfig(BaseModel):
+    grid_sizes: List[int]
+    house_edge: float
+    tables: List[MultiplierTable]
 
 class GameHistory(BaseModel):
     id: int
@@ -85,9 +118,13 @@ class UserStats(BaseModel):
     balance: float
     created_at: datetime
 
+class UserRank(UserStats):
+    total_users: int
+
 class Leaderboard(BaseModel):
     users: List[UserStats]
     total_users: int
+    next_cursor: Optional[str] = None  # pass as ?cursor= for the next page
 
 # Auth Response
 class Token(BaseModel):
@@ -3,9 +3,12 @@ from app.utils.auth import (
     get_password_hash, 
     verify_password, 
     create_access_token,
+    decode_token,
     verify_token,
     authenticate_user
 )
+from app.utils.password_pool import password_hasher, PasswordHasherBusy
+from app.utils.principal_cache import principal_cache, Principal
 from app.utils.game_engine import GameEngine, MineField
 from app.utils.logger import setup_logging, log_user_action, log_game_action, log_error
 
@@ -13,8 +16,13 @@ __all__ = [
     'get_password_hash',
     'verify_password',
     'create_access_token',
+    'decode_token',
     'verify_token',
     'authenticate_user',
+    'password_hasher',
+    'PasswordHasherBusy',
+    'principal_cache',
+    'Principal',
     'GameEngine',
     'MineField',
     'setup_logging',
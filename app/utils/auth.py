@@ -1,16 +1,17 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from app.database import get_settings
-from sqlalchemy.orm import Session
+from app.utils.password_pool import build_crypt_context, password_hasher
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import User
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (inline; request handlers go through password_hasher)
+pwd_context = build_crypt_context(get_settings().bcrypt_rounds)
 
 def get_password_hash(password: str) -> str:
     """Hash password using bcrypt"""
@@ -34,32 +35,45 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
-def verify_token(token: str) -> Optional[str]:
-    """Verify JWT token and return username"""
+def decode_token(token: str) -> Optional[dict]:
+    """Verify JWT token and return its claims (sub, uid, exp)"""
     settings = get_settings()
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        username: str = payload.get("sub")
-        if username is None:
+        if payload.get("sub") is None:
             return None
-        return username
+        return payload
     except JWTError:
         logger.warning(f"Invalid token attempted to be decoded")
         return None
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-    """Authenticate user with username and password"""
-    user = db.query(User).filter(User.username == username).first()
+def verify_token(token: str) -> Optional[str]:
+    """Verify JWT token and return username"""
+    payload = decode_token(token)
+    return payload["sub"] if payload else None
+
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
+    """Authenticate user with username and password.
+
+    Hashes stored at a different bcrypt cost than configured are
+    transparently re-hashed on successful login.
+    """
+    user = await get_user_by_username(db, username)
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    valid, new_hash = await password_hasher.verify(password, user.password_hash)
+    if not valid:
         return None
+    if new_hash:
+        user.password_hash = new_hash
+        await db.commit()
+        logger.info(f"Upgraded password hash cost for user {user.id}")
     return user
 
-def get_user_by_username(db: Session, username: str) -> Optional[User]:
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
     """Get user by username"""
-    return db.query(User).filter(User.username == username).first()
+    return await db.scalar(select(User).where(User.username == username))
 
-def get_user_by_id(db: Session, user_id: int) -> Optional[User]:
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
     """Get user by ID"""
-    return db.query(User).filter(User.id == user_id).first()
+    return await db.get(User, user_id)
@@ -0,0 +1,89 @@
+"""Running casino totals kept in casino_aggregates.
+
+Every bet and payout adds to three buckets (all-time, its hour and its
+day) in the transaction that moves the money, so the totals always agree
+with the ledger. Reads sum a handful of shard rows instead of scanning
+users or games.
+"""
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_settings
+from app.models import CasinoAggregate, AggregatePeriod
+
+EPOCH = datetime(1970, 1, 1)
+# Windows up to this long are answered from hourly buckets, longer ones
+# from daily buckets (rounded up to whole days)
+HOURLY_WINDOW_HOURS = 72
+
+def _insert(db: AsyncSession):
+    """INSERT with the ON CONFLICT construct of the database ``db`` runs on"""
+    if db.get_bind(CasinoAggregate).dialect.name == "postgresql":
+        return postgresql.insert(CasinoAggregate)
+    return sqlite.insert(CasinoAggregate)
+
+def bucket_starts(at: datetime) -> Tuple[Tuple[AggregatePeriod, datetime], ...]:
+    hour = at.replace(minute=0, second=0, microsecond=0)
+    return (
+        (AggregatePeriod.TOTAL, EPOCH),
+        (AggregatePeriod.HOUR, hour),
+        (AggregatePeriod.DAY, hour.replace(hour=0)),
+    )
+
+async def add_to_aggregates(
+    db: AsyncSession,
+    user_id: int,
+    wagered_cents: int = 0,
+    won_cents: int = 0,
+    games: int = 0,
+    at: Optional[datetime] = None
+) -> None:
+    """Upsert the deltas into this user's shard of every bucket (caller commits)"""
+    shard = user_id % get_settings().casino_aggregate_shards
+    stmt = _insert(db).values([
+        {
+            'period': period.value,
+            'bucket_start': start,
+            'shard': shard,
+            'wagered_cents': wagered_cents,
+            'won_cents': won_cents,
+            'games': games,
+        }
+        for period, start in bucket_starts(at or datetime.utcnow())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CasinoAggregate.period, CasinoAggregate.bucket_start, CasinoAggregate.shard],
+        set_={
+            'wagered_cents': CasinoAggregate.wagered_cents + stmt.excluded.wagered_cents,
+            'won_cents': CasinoAggregate.won_cents + stmt.excluded.won_cents,
+            'games': CasinoAggregate.games + stmt.excluded.games,
+        }
+    )
+    await db.execute(stmt)
+
+async def read_totals(db: AsyncSession, hours: Optional[int] = None) -> Tuple[int, int, int, Optional[datetime]]:
+    """(wagered_cents, won_cents, games, since) all-time or for the last ``hours``"""
+    query = select(
+        func.coalesce(func.sum(CasinoAggregate.wagered_cents), 0),
+        func.coalesce(func.sum(CasinoAggregate.won_cents), 0),
+        func.coalesce(func.sum(CasinoAggregate.games), 0)
+    )
+    since = None
+    if hours is None:
+        query = query.where(CasinoAggregate.period == AggregatePeriod.TOTAL.value)
+    else:
+        current_hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        if hours <= HOURLY_WINDOW_HOURS:
+            period = AggregatePeriod.HOUR
+            since = current_hour - timedelta(hours=hours - 1)
+        else:
+            period = AggregatePeriod.DAY
+            since = current_hour.replace(hour=0) - timedelta(days=(hours - 1) // 24)
+        query = query.where(
+            CasinoAggregate.period == period.value,
+            CasinoAggregate.bucket_start >= since
+        )
+    wagered, won, games = (await db.execute(query)).one()
+    return int(wagered), int(won), int(games), since
@@ -0,0 +1,232 @@
+"""Per-process cache of active games for the click path.
+
+Active games are kept as detached Game objects so clicks are answered
+from memory. Safe clicks only mark the entry dirty; a background task
+writes dirty boards back every GAME_CACHE_FLUSH_SECONDS, while terminal
+transitions (LOST/CLAIMED) are persisted by the request itself and the
+entry is dropped.
+
+The database stays the source of truth: a restarted process starts cold
+and reloads games on first access, losing at most one flush interval of
+safe clicks (never money, since bets and payouts are written
+synchronously). Every write is conditional on Game.state_version, so two
+replicas serving the same game cannot silently overwrite each other; the
+loser gets GameStateConflict and reloads. Route game traffic with session
+affinity (see kubernetes/app-service.yaml) so a game normally stays on one
+replica.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_settings, create_async_session
+from app.models import Game, GameStatus
+import logging
+
+logger = logging.getLogger(__name__)
+
+class GameStateConflict(Exception):
+    """The stored game was changed by another process since it was cached"""
+
+@dataclass
+class CacheEntry:
+    game: Game
+    revision: int = 0  # bumped on every in-memory change
+    flushed_revision: int = 0
+    last_flush: float = field(default_factory=time.monotonic)
+    last_access: float = field(default_factory=time.monotonic)
+    # Serialises write-backs of this game between the flusher and requests
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    @property
+    def dirty(self) -> bool:
+        return self.revision != self.flushed_revision
+
+class ActiveGameCache:
+    """LRU map of game id -> active game with write-behind persistence"""
+
+    def __init__(self, enabled: bool, max_entries: int, flush_seconds: float, idle_seconds: float):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.flush_seconds = flush_seconds
+        self.idle_seconds = idle_seconds
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.conflicts = 0
+
+    def peek(self, game_id: int) -> Optional[Game]:
+        entry = self._entries.get(game_id)
+        return entry.game if entry else None
+
+    async def get(self, db: AsyncSession, game_id: int) -> Optional[Game]:
+        """Return the cached game, loading (and caching) it on a miss"""
+        entry = self._entries.get(game_id)
+        if entry is not None:
+            self.hits += 1
+            entry.last_access = time.monotonic()
+            self._entries.move_to_end(game_id)
+            return entry.game
+
+        self.misses += 1
+        game = await db.get(Game, game_id)
+        # Another request may have cached the game while we were loading it
+        entry = self._entries.get(game_id)
+        if entry is not None:
+            return entry.game
+        if game is not None:
+            # Detached either way: all board writes go through persist()
+            db.expunge(game)
+            if game.status == GameStatus.ACTIVE:
+                self.put(game)
+        return game
+
+    def put(self, game: Game) -> None:
+        """Cache a detached active game"""
+        if self.enabled:
+            self._entries[game.id] = CacheEntry(game=game)
+
+    def evict(self, game_id: int) -> None:
+        self._entries.pop(game_id, None)
+
+    async def record_change(self, db: AsyncSession, game: Game) -> None:
+        """Note a non-terminal change; written back by the flusher"""
+        entry = self._entries.get(game.id)
+        if entry is None:
+            await self.persist(db, game)
+            await db.commit()
+            return
+        entry.revision += 1
+
+    async def persist(self, db: AsyncSession, game: Game) -> None:
+        """Write the board with an optimistic version check (caller commits)"""
+        entry = self._entries.get(game.id)
+        if entry is None:
+            await self._write(db, game)
+            return
+        async with entry.lock:
+            await self._write(db, game)
+
+    async def _write(self, db: AsyncSession, game: Game) -> None:
+        expected = game.state_version
+        result = await db.execute(
+            update(Game)
+            .where(Game.id == game.id, Game.state_version == expected)
+            .values(
+                mine_mask=game.mine_mask,
+                revealed_mask=game.revealed_mask,
+                legacy_grid_state=None,
+                legacy_revealed_cells=None,
+                current_multiplier=game.current_multiplier,
+                status=game.status,
+                prize_cents=game.prize_cents,
+                updated_at=game.updated_at or datetime.utcnow(),
+                state_version=expected + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            self.conflicts += 1
+            self.evict(game.id)
+            raise GameStateConflict(f"Game {game.id} was modified elsewhere")
+        game.state_version = expected + 1
+
+    async def flush(self, force: bool = False) -> int:
+        """Write back dirty entries whose flush interval has elapsed"""
+        now = time.monotonic()
+        due = [
+            (game_id, entry, entry.revision) for game_id, entry in self._entries.items()
+            if entry.dirty and (force or now - entry.last_flush >= self.flush_seconds)
+        ]
+        if not due:
+            return 0
+
+        written = 0
+        db = create_async_session()
+        try:
+            for game_id, entry, revision in due:
+                try:
+                    async with entry.lock:
+                        if self._entries.get(game_id) is not entry:
+                            continue  # finished and written by its request meanwhile
+                        await self._write(db, entry.game)
+                        await db.commit()
+                except GameStateConflict:
+                    await db.rollback()
+                    logger.warning(f"Dropped cached game {game_id} after a version conflict")
+                    continue
+                except Exception:
+                    await db.rollback()
+                    self.evict(game_id)
+                    logger.exception(f"Failed to flush cached game {game_id}")
+                    continue
+                entry.flushed_revision = revision
+                entry.last_flush = now
+                written += 1
+        finally:
+            await db.close()
+        self.flushes += written
+        return written
+
+    def _expire(self) -> None:
+        """Drop clean entries that are idle, finished or over capacity"""
+        now = time.monotonic()
+        overflow = len(self._entries) - self.max_entries
+        for game_id, entry in list(self._entries.items()):
+            if entry.dirty:
+                continue
+            if overflow > 0 or entry.game.status != GameStatus.ACTIVE or now - entry.last_access >= self.idle_seconds:
+                self.evict(game_id)
+                overflow -= 1
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+                self._expire()
+            except Exception:
+                logger.exception("Active game cache flush failed")
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the flusher and write back everything still dirty"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush(force=True)
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'dirty': sum(1 for entry in self._entries.values() if entry.dirty),
+            'hits': self.hits,
+            'misses': self.misses,
+            'flushes': self.flushes,
+            'conflicts': self.conflicts,
+        }
+
+def _build_cache() -> ActiveGameCache:
+    settings = get_settings()
+    return ActiveGameCache(
+        enabled=settings.game_cache_enabled,
+        max_entries=settings.game_cache_max_entries,
+        flush_seconds=settings.game_cache_flush_seconds,
+        idle_seconds=settings.game_cache_idle_seconds
+    )
+
+game_cache = _build_cache()
@@ -1,5 +1,9 @@
 import random
+from fractions import Fraction
+from functools import lru_cache
+import json
 from typing import Dict, List, Tuple, Optional
+from app.database import get_settings
 from app.models import Game, GameStatus
 import logging
 
@@ -75,51 +79,159 @@ class GameEngine:
     
     # Global house edge factor (< 1.0 means casino advantage)
     HOUSE_EDGE = 0.97  # ~3% casino edge on otherwise fair odds
+
+    # Largest board the engine accepts from configuration (10x10)
+    MAX_GRID_SIZE = 10
+
+    @staticmethod
+    @lru_cache()
+    def allowed_grid_sizes() -> Tuple[int, ...]:
+        """Grid sizes enabled through GRID_SIZES (e.g. "3,4,5,8,10")"""
+        sizes = sorted({int(size) for size in get_settings().grid_sizes.split(",") if size.strip()})
+        invalid = [size for size in sizes if not 2 <= size <= GameEngine.MAX_GRID_SIZE]
+        if invalid:
+            raise ValueError(f"Unsupported grid sizes in GRID_SIZES: {invalid}")
+        return tuple(sizes)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def multiplier_table(grid_size: int, mines_count: int) -> Tuple[float, ...]:
+        """Multipliers for 0..safe_total safe clicks on one board config.
+
+        The fair multiplier after k safe clicks is the product of
+        1 / P(safe) for each click without replacement. It is accumulated
+        as an exact fraction, the house edge is applied, and only then is
+        the value rounded to cents, so each entry is computed exactly once.
+        """
+        total_cells = grid_size * grid_size
+        safe_total = total_cells - mines_count
+        if safe_total <= 0:
+            return (1.0,)
+
+        house_edge = Fraction(str(GameEngine.HOUSE_EDGE))
+        fair = Fraction(1)
+        table = [1.0]
+        for k in range(safe_total):
+            fair *= Fraction(total_cells - k, safe_total - k)
+            table.append(float(round(fair * house_edge, 2)))
+        return tuple(table)
+
+    @staticmethod
+    def build_multiplier_tables() -> int:
+        """Precompute tables for every configured grid size and mine count"""
+        entries = 0
+        for grid_size in GameEngine.allowed_grid_sizes():
+            for mines_count in range(1, grid_size * grid_size):
+                entries += len(GameEngine.multiplier_table(grid_size, mines_count))
+        logger.info(f"Built multiplier tables ({entries} entries)")
+        return entries
     
     @staticmethod
-    def create_minefield(grid_size: int, mines_count: int) -> Tuple[List[List[int]], Dict]:
-        """Create new mine field and return grid and state"""
+    def create_minefield(grid_size: int, mines_count: int) -> Tuple[List[List[int]], int]:
+        """Create new mine field and return grid and mine bitmask"""
         field = MineField(grid_size, mines_count)
-        grid_dict = {str(i): {str(j): field.grid[i][j] for j in range(grid_size)} 
-                     for i in range(grid_size)}
-        return field.grid, grid_dict
+        mine_mask = 0
+        for i in range(grid_size):
+            for j in range(grid_size):
+                if field.grid[i][j]:
+                    mine_mask |= GameEngine.cell_bit(grid_size, i, j)
+        return field.grid, mine_mask
+
+    # Board bitmasks: bit (row * grid_size + col) is set for a mine in
+    # mine_mask and for an opened cell in revealed_mask.
+    @staticmethod
+    def cell_bit(grid_size: int, row: int, col: int) -> int:
+        return 1 << (row * grid_size + col)
+
+    @staticmethod
+    def full_mask(grid_size: int) -> int:
+        return (1 << (grid_size * grid_size)) - 1
+
+    @staticmethod
+    def decode_legacy_board(grid_size: int, grid_state, revealed_cells) -> Tuple[int, int]:
+        """Convert the old JSON board ({"r": {"c": 0/1}} plus {"r,c": bool})
+        into (mine_mask, revealed_mask)"""
+        grid = json.loads(grid_state) if isinstance(grid_state, str) else (grid_state or {})
+        mine_mask = 0
+        for r in range(grid_size):
+            for c in range(grid_size):
+                if grid.get(str(r), {}).get(str(c), 0):
+                    mine_mask |= GameEngine.cell_bit(grid_size, r, c)
+
+        revealed_mask = 0
+        for key in (revealed_cells if isinstance(revealed_cells, dict) else {}):
+            r, c = (int(part) for part in key.split(","))
+            revealed_mask |= GameEngine.cell_bit(grid_size, r, c)
+        return mine_mask, revealed_mask
+
+    @staticmethod
+    def board_masks(game: Game) -> Tuple[int, int]:
+        """Return (mine_mask, revealed_mask), reading legacy JSON rows too"""
+        if game.mine_mask is not None and game.revealed_mask is not None:
+            return game.mine_mask, game.revealed_mask
+        return GameEngine.decode_legacy_board(
+            game.grid_size,
+            game.legacy_grid_state,
+            game.legacy_revealed_cells
+        )
+
+    @staticmethod
+    def store_board(game: Game, mine_mask: int, revealed_mask: int) -> None:
+        """Write masks back, dropping any legacy JSON copy of the board"""
+        game.mine_mask = mine_mask
+        game.revealed_mask = revealed_mask
+        if game.legacy_grid_state is not None or game.legacy_revealed_cells is not None:
+            game.legacy_grid_state = None
+            game.legacy_revealed_cells = None
+
+    @staticmethod
+    def mask_cells(grid_size: int, mine_mask: int, mask: int) -> Dict[str, bool]:
+        """Cells set in ``mask`` as {"r,c": is_mine}"""
+        cells = {}
+        remaining = mask
+        while remaining:
+            low_bit = remaining & -remaining
+            index = low_bit.bit_length() - 1
+            cells[f"{index // grid_size},{index % grid_size}"] = bool(mine_mask & low_bit)
+            remaining ^= low_bit
+        return cells
+
+    @staticmethod
+    def revealed_cells(game: Game) -> Dict[str, bool]:
+        """Revealed cells as {"r,c": is_mine} for API responses"""
+        mine_mask, revealed_mask = GameEngine.board_masks(game)
+        return GameEngine.mask_cells(game.grid_size, mine_mask, revealed_mask)
+
+    @staticmethod
+    def compact_board(game: Game) -> Tuple[str, str]:
+        """(revealed, mines) as hex masks for the compact game state;
+        mines are only given for revealed cells"""
+        mine_mask, revealed_mask = GameEngine.board_masks(game)
+        return format(revealed_mask, "x"), format(mine_mask & revealed_mask, "x")
+
+    @staticmethod
+    def reveal_board(game: Game) -> None:
+        """Open every cell so the frontend can show the final board"""
+        mine_mask, _ = GameEngine.board_masks(game)
+        GameEngine.store_board(game, mine_mask, GameEngine.full_mask(game.grid_size))
     
     @staticmethod
     def get_multiplier(grid_size: int, mines_count: int, safe_clicks: int) -> float:
         """Calculate current multiplier based on safe clicks with a house edge.
 
-        We approximate a fair multiplier as the product of 1 / P(success)
-        for each safe click without replacement, then apply HOUSE_EDGE
-        (< 1) so the expected return is slightly negative for the player.
+        Looks the value up in the precomputed multiplier table; see
+        multiplier_table for how the entries are derived.
         """
-        total_cells = grid_size * grid_size
-        safe_total = total_cells - mines_count
-
-        if safe_clicks <= 0 or safe_total <= 0:
+        if safe_clicks <= 0 or grid_size * grid_size - mines_count <= 0:
             return 1.0
 
-        multiplier = 1.0
-        # For each safe click so far, multiply by the inverse of the
-        # probability that that click was safe.
-        for k in range(safe_clicks):
-            safe_remaining = safe_total - k
-            total_remaining = total_cells - k
-            if safe_remaining <= 0 or total_remaining <= 0:
-                break
-            prob_safe = safe_remaining / total_remaining
-            if prob_safe <= 0:
-                break
-            fair_factor = 1.0 / prob_safe
-            multiplier *= fair_factor
-
-        # Apply casino edge
-        multiplier *= GameEngine.HOUSE_EDGE
-        return round(multiplier, 2)
+        table = GameEngine.multiplier_table(grid_size, mines_count)
+        return table[min(safe_clicks, len(table) - 1)]
     
     @staticmethod
-    def calculate_prize(bet_amount: float, multiplier: float) -> float:
-        """Calculate prize amount"""
-        return round(bet_amount * multiplier, 2)
+    def calculate_prize(bet_cents: int, multiplier: float) -> int:
+        """Calculate prize in cents (multipliers carry two decimals; half-up)"""
+        return (bet_cents * round(multiplier * 100) + 50) // 100
     
     @staticmethod
     def validate_game_params(grid_size: int, mines_count: int) -> bool:
@@ -127,7 +239,7 @@ class GameEngine:
         total_cells = grid_size * grid_size
         
         # Check grid size
-        if grid_size not in [3, 4, 5]:
+        if grid_size not in GameEngine.allowed_grid_sizes():
             return False
         
         # Check mines count is reasonable
@@ -148,78 +260,79 @@ class GameEngine:
             'message': str
         }
         """
-        import json
-        
-        # Validate cell position
-        if not (0 <= row < game.grid_size and 0 <= col < game.grid_size):
-            return {
-                'hit_mine': False,
-                'safe_clicks': 0,
-                'multiplier': game.current_multiplier,
-                'prize_amount': game.prize_amount,
-                'message': 'Invalid cell position',
-                'error': True
-            }
-        
-        # Check if already revealed
-        revealed_str = f"{row},{col}"
-        if revealed_str in game.revealed_cells:
+        return GameEngine.reveal_cells(game, [(row, col)])
+
+    @staticmethod
+    def reveal_cells(game: Game, cells: List[Tuple[int, int]]) -> Dict:
+        """
+        Reveal cells in order in one pass, stopping at the first mine.
+        Nothing is changed if any cell is invalid or already revealed.
+        Returns the process_click dict plus 'revealed' (cells opened).
+        """
+        mine_mask, revealed_mask = GameEngine.board_masks(game)
+
+        def rejected(message: str) -> Dict:
             return {
                 'hit_mine': False,
                 'safe_clicks': 0,
+                'revealed': 0,
                 'multiplier': game.current_multiplier,
                 'prize_amount': game.prize_amount,
-                'message': 'Cell already revealed',
+                'message': message,
                 'error': True
             }
-        
-        # Check if hit mine
-        grid = json.loads(game.grid_state) if isinstance(game.grid_state, str) else game.grid_state
-        is_mine = bool(grid[str(row)].get(str(col), 0))
-        
-        # Update revealed cells
-        revealed_cells = game.revealed_cells.copy() if isinstance(game.revealed_cells, dict) else {}
-        revealed_cells[revealed_str] = is_mine
-        game.revealed_cells = revealed_cells
+
+        # Validate the whole batch before touching the board
+        bits = []
+        requested = revealed_mask
+        for row, col in cells:
+            if not (0 <= row < game.grid_size and 0 <= col < game.grid_size):
+                return rejected('Invalid cell position')
+            bit = GameEngine.cell_bit(game.grid_size, row, col)
+            if requested & bit:
+                return rejected('Cell already revealed')
+            requested |= bit
+            bits.append(bit)
+
+        safe_clicks = (revealed_mask & ~mine_mask).bit_count()
         game.updated_at = __import__('datetime').datetime.utcnow()
-        
-        if is_mine:
-            game.status = GameStatus.LOST
-            game.prize_amount = 0
-
-            # Reveal entire board so frontend can freeze final state
-            for r in range(game.grid_size):
-                for c in range(game.grid_size):
-                    key = f"{r},{c}"
-                    if key not in revealed_cells:
-                        cell_is_mine = bool(grid[str(r)].get(str(c), 0))
-                        revealed_cells[key] = cell_is_mine
-            game.revealed_cells = revealed_cells
 
-            return {
-                'hit_mine': True,
-                'safe_clicks': len([v for v in game.revealed_cells.values() if not v]),
-                'multiplier': game.current_multiplier,
-                'prize_amount': 0,
-                'message': 'Hit a mine! Game over.'
-            }
-        else:
-            # Safe click - update multiplier
-            safe_clicks = len([v for v in game.revealed_cells.values() if not v])
-            multiplier = GameEngine.get_multiplier(
-                game.grid_size, 
-                game.mines_count, 
-                safe_clicks
-            )
-            prize = GameEngine.calculate_prize(game.bet_amount, multiplier)
-            
-            game.current_multiplier = multiplier
-            game.prize_amount = prize
-            
-            return {
-                'hit_mine': False,
-                'safe_clicks': safe_clicks,
-                'multiplier': multiplier,
-                'prize_amount': prize,
-                'message': f'Safe! Current multiplier: {multiplier}x, Prize: ${prize:.2f}'
-            }
+        for opened, bit in enumerate(bits, 1):
+            if mine_mask & bit:
+                game.status = GameStatus.LOST
+                game.prize_cents = 0
+
+                # Reveal entire board so frontend can freeze final state
+                GameEngine.store_board(game, mine_mask, GameEngine.full_mask(game.grid_size))
+
+                return {
+                    'hit_mine': True,
+                    'safe_clicks': safe_clicks + opened - 1,
+                    'revealed': opened,
+                    'multiplier': game.current_multiplier,
+                    'prize_amount': 0,
+                    'message': 'Hit a mine! Game over.'
+                }
+
+        # All safe - update multiplier once for the whole batch
+        GameEngine.store_board(game, mine_mask, requested)
+        safe_clicks += len(bits)
+        multiplier = GameEngine.get_multiplier(
+            game.grid_size, 
+            game.mines_count, 
+            safe_clicks
+        )
+        prize_cents = GameEngine.calculate_prize(game.bet_cents, multiplier)
+        prize = prize_cents / 100
+        
+        game.current_multiplier = multiplier
+        game.prize_cents = prize_cents
+        
+        return {
+            'hit_mine': False,
+            'safe_clicks': safe_clicks,
+            'revealed': len(bits),
+            'multiplier': multiplier,
+            'prize_amount': prize,
+            'message': f'Safe! Current multiplier: {multiplier}x, Prize: ${prize:.2f}'
+        }
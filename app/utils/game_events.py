@@ -0,0 +1,162 @@
+"""Buffered writer for the game_events table.
+
+Requests append events to an in-process list; a background task writes
+them in one round trip per batch (COPY on PostgreSQL, a multi-row
+executemany elsewhere) every GAME_EVENTS_FLUSH_SECONDS, or sooner once
+GAME_EVENTS_BATCH_SIZE are waiting. If GAME_EVENTS_MAX_PENDING events
+pile up (the database is slow or down), writers wait for a flush instead
+of growing the buffer further. Pending events are flushed on shutdown;
+a hard crash loses at most one flush interval of them.
+"""
+import asyncio
+import csv
+import io
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert
+from app import database
+from app.database import get_settings
+from app.models import GameEvent, GameEventType
+import logging
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("game_id", "user_id", "event_type", "row", "col", "multiplier", "amount_cents", "created_at")
+
+class GameEventBuffer:
+    """Collects game events and writes them in batches"""
+
+    def __init__(self, enabled: bool, batch_size: int, flush_seconds: float, max_pending: int):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._pending: List[Tuple] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.waits = 0
+
+    async def record(
+        self,
+        game_id: int,
+        user_id: int,
+        event_type: GameEventType,
+        row: Optional[int] = None,
+        col: Optional[int] = None,
+        multiplier: Optional[float] = None,
+        amount_cents: Optional[int] = None
+    ) -> None:
+        if not self.enabled:
+            return
+        if len(self._pending) >= self.max_pending:
+            # Back-pressure: the producer pays for the flush
+            self.waits += 1
+            await self.flush()
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+        self._pending.append(
+            (game_id, user_id, event_type.value, row, col, multiplier, amount_cents, datetime.utcnow())
+        )
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Write everything pending; on failure the events are kept for the next try"""
+        async with self._flush_lock:
+            written = 0
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:len(batch)]
+                try:
+                    await self._write(batch)
+                except Exception:
+                    self._pending[:0] = batch
+                    self.failures += 1
+                    logger.exception(f"Failed to write {len(batch)} game events")
+                    break
+                written += len(batch)
+                self.batches += 1
+            self.written += written
+            return written
+
+    async def _write(self, rows: List[Tuple]) -> None:
+        async_engine = database.get_async_engine()
+        if async_engine is None:
+            await run_in_threadpool(self._write_sync, rows)
+            return
+        async with async_engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                raw = await conn.get_raw_connection()
+                await raw.driver_connection.copy_records_to_table(
+                    GameEvent.__tablename__, records=rows, columns=COLUMNS
+                )
+            else:
+                await conn.execute(insert(GameEvent.__table__), [dict(zip(COLUMNS, row)) for row in rows])
+
+    def _write_sync(self, rows: List[Tuple]) -> None:
+        with database.get_engine().begin() as conn:
+            if conn.dialect.name == "postgresql":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(
+                    tuple("" if value is None else value for value in row) for row in rows
+                )
+                buffer.seek(0)
+                cursor = conn.connection.cursor()
+                cursor.copy_expert(
+                    f"COPY {GameEvent.__tablename__} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+            else:
+                conn.execute(insert(GameEvent.__table__), [dict(zip(COLUMNS, row)) for row in rows])
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the flusher and write whatever is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            'pending': len(self._pending),
+            'written': self.written,
+            'batches': self.batches,
+            'failures': self.failures,
+            'waits': self.waits,
+            'dropped': self.dropped,
+        }
+
+def _build_buffer() -> GameEventBuffer:
+    settings = get_settings()
+    return GameEventBuffer(
+        enabled=settings.game_events_enabled,
+        batch_size=settings.game_events_batch_size,
+        flush_seconds=settings.game_events_flush_seconds,
+        max_pending=settings.game_events_max_pending
+    )
+
+game_events = _build_buffer()
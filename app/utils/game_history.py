@@ -0,0 +1,121 @@
+"""Keyset paging and streaming export of a user's games.
+
+History is ordered newest first by (created_at, id) and served from the
+ix_games_user_created_id index. A page continues from an opaque cursor
+naming the last game returned, so deep pages cost the same as the first
+one instead of growing with OFFSET.
+"""
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Optional, Tuple
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Game
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = (
+    "id",
+    "created_at",
+    "bet_amount",
+    "grid_size",
+    "mines_count",
+    "status",
+    "multiplier",
+    "prize_amount",
+)
+
+def encode_cursor(created_at: datetime, game_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{game_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError on anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, game_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(game_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def history_query(user_id: int, after: Optional[Tuple[datetime, int]] = None, columns: tuple = ()):
+    """Newest-first games of a user, older than the (created_at, id) ``after``"""
+    query = select(*columns) if columns else select(Game)
+    query = query.where(Game.user_id == user_id)
+    if after:
+        query = query.where(tuple_(Game.created_at, Game.id) < after)
+    return query.order_by(Game.created_at.desc(), Game.id.desc())
+
+async def history_page(
+    db: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0
+) -> Tuple[list, Optional[str]]:
+    """One page of games and the cursor of the next page (None at the end).
+
+    ``skip`` is kept for clients that still page by offset and is ignored
+    once a cursor is given.
+    """
+    query = history_query(user_id, decode_cursor(cursor) if cursor else None).limit(limit)
+    if skip and not cursor:
+        query = query.offset(skip)
+    games = (await db.scalars(query)).all()
+    next_cursor = None
+    if len(games) == limit:
+        next_cursor = encode_cursor(games[-1].created_at, games[-1].id)
+    return games, next_cursor
+
+async def _export_batches(db: AsyncSession, user_id: int) -> AsyncIterator[list]:
+    """All of a user's games as plain tuples, one keyset batch at a time"""
+    columns = (
+        Game.id,
+        Game.created_at,
+        Game.bet_cents,
+        Game.grid_size,
+        Game.mines_count,
+        Game.status,
+        Game.current_multiplier,
+        Game.prize_cents,
+    )
+    after = None
+    while True:
+        rows = (await db.execute(
+            history_query(user_id, after, columns).limit(EXPORT_BATCH_SIZE)
+        )).all()
+        if rows:
+            yield [
+                (
+                    row.id,
+                    row.created_at.isoformat(),
+                    row.bet_cents / 100,
+                    row.grid_size,
+                    row.mines_count,
+                    row.status,
+                    row.current_multiplier,
+                    row.prize_cents / 100,
+                )
+                for row in rows
+            ]
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+        after = (rows[-1].created_at, rows[-1].id)
+
+async def export_ndjson(db: AsyncSession, user_id: int) -> AsyncIterator[str]:
+    async for batch in _export_batches(db, user_id):
+        yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in batch)
+
+async def export_csv(db: AsyncSession, user_id: int) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for batch in _export_batches(db, user_id):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # header only
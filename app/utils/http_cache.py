@@ -0,0 +1,137 @@
+"""HTTP caching for hot read endpoints.
+
+Global views (leaderboard pages, casino stats) are the same for every
+caller, so their serialized JSON is kept in a per-process TTL cache for
+RESPONSE_CACHE_TTL_SECONDS and served as-is, with an ETag over the body.
+A miss is built once per worker however many requests arrive while it
+is being built (see single_flight).
+Per-user and per-game views get a strong ETag built from the row's
+version columns, so a revalidation costs the row lookup but no body.
+
+Every cached route answers If-None-Match with 304. The Cache-Control
+policies below are ``private`` because these routes sit behind bearer
+auth, so only the browser caches them; a shared cache like nginx keys on
+the URL alone and would serve one user's view to everyone.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Hashable, Optional, Tuple
+from fastapi import Request, Response
+from app.database import get_settings
+from app.utils.single_flight import single_flight
+
+# Views whose content changes: revalidate before every reuse
+REVALIDATE = "private, no-cache"
+# Finished games never change
+IMMUTABLE = "private, max-age=86400, immutable"
+
+def _etag(data: bytes) -> str:
+    return '"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"'
+
+def make_etag(*parts) -> str:
+    """Strong ETag over the given version fields"""
+    return _etag(repr(parts).encode())
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True if If-None-Match names ``etag`` (weak comparison, per RFC 9110)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # nginx weakens ETags of responses it gzips, so W/ matches too
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+def conditional(request: Request, response: Response, etag: str, cache_control: str = REVALIDATE) -> Optional[Response]:
+    """304 if the client already has ``etag``; otherwise tag ``response`` and return None"""
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    return None
+
+@dataclass(frozen=True)
+class CachedBody:
+    body: bytes
+    etag: str
+    expires_at: float
+
+    def respond(self, request: Request, cache_control: str) -> Response:
+        if etag_matches(request, self.etag):
+            return not_modified(self.etag, cache_control)
+        return Response(
+            content=self.body,
+            media_type="application/json",
+            headers={"ETag": self.etag, "Cache-Control": cache_control}
+        )
+
+class ResponseCache:
+    """Per-process TTL cache of serialized JSON responses shared by all callers"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache_control(self) -> str:
+        """Policy for responses from this cache: reusable as long as they are cached here"""
+        return f"private, max-age={int(self.ttl_seconds)}" if self.ttl_seconds >= 1 else REVALIDATE
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() >= entry.expires_at:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, body: bytes) -> CachedBody:
+        """Cache ``body`` under ``key`` and return it (uncached when disabled)"""
+        entry = CachedBody(
+            body=body,
+            etag=_etag(body),
+            expires_at=time.monotonic() + self.ttl_seconds
+        )
+        if self.ttl_seconds > 0 and self.max_entries > 0:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    async def get_or_build(self, key: Tuple, build: Callable[[], Awaitable[bytes]]) -> CachedBody:
+        """Cached body for ``key``, building it with ``build()`` on a miss.
+
+        Concurrent misses for the same key share one build.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        return await single_flight.run(key, lambda: self._build(key, build))
+
+    async def _build(self, key: Tuple, build: Callable[[], Awaitable[bytes]]) -> CachedBody:
+        return self.put(key, await build())
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+def _build_cache() -> ResponseCache:
+    settings = get_settings()
+    return ResponseCache(settings.response_cache_ttl_seconds, settings.response_cache_max_entries)
+
+response_cache = _build_cache()
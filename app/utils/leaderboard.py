@@ -0,0 +1,170 @@
+"""Per-process ranking of users by total winnings.
+
+Users are kept in a SortedList keyed by (-total_won_cents, id), so the
+top K is a slice, a user's rank is one bisect (O(log n)) and pages past
+the top start from a cursor instead of an OFFSET.
+
+Wallet updates made by this process are applied as soon as they commit.
+Changes made by other replicas are picked up by sync(), which reloads
+users whose updated_at moved since the last sync at most once every
+LEADERBOARD_REFRESH_SECONDS. Each entry carries User.version, so an older
+row never overwrites a newer one. sync() may read from a replica (see
+read_replica), so its window also overlaps by the replica's allowed lag.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sortedcontainers import SortedList
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_settings
+from app.models import User
+
+@dataclass
+class RankedUser:
+    id: int
+    username: str
+    total_games: int
+    total_wagered_cents: int
+    total_won_cents: int
+    balance_cents: int
+    version: int
+    created_at: datetime
+
+    @classmethod
+    def from_row(cls, row) -> "RankedUser":
+        """Build from a User or a row with the same columns"""
+        return cls(
+            id=row.id,
+            username=row.username,
+            total_games=row.total_games,
+            total_wagered_cents=row.total_wagered_cents,
+            total_won_cents=row.total_won_cents,
+            balance_cents=row.balance_cents,
+            version=row.version,
+            created_at=row.created_at
+        )
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return (-self.total_won_cents, self.id)
+
+_COLUMNS = (
+    User.id,
+    User.username,
+    User.total_games,
+    User.total_wagered_cents,
+    User.total_won_cents,
+    User.balance_cents,
+    User.version,
+    User.created_at,
+    User.is_active,
+)
+
+def encode_cursor(entry: RankedUser) -> str:
+    return f"{entry.total_won_cents}:{entry.id}"
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Sort key just after the entry a cursor points at; raises ValueError"""
+    won_cents, user_id = cursor.split(":")
+    return (-int(won_cents), int(user_id))
+
+class LeaderboardIndex:
+    """Order-statistic index of active users by total_won_cents"""
+
+    def __init__(self, refresh_seconds: float, lag_seconds: float = 0.0):
+        self.refresh_seconds = refresh_seconds
+        self.lag_seconds = lag_seconds
+        self._keys = SortedList()
+        self._users: Dict[int, RankedUser] = {}
+        self._loaded = False
+        self._synced_at = 0.0
+        self._watermark: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def upsert(self, entry: RankedUser) -> None:
+        current = self._users.get(entry.id)
+        if current is not None:
+            if current.version > entry.version:
+                return
+            self._keys.remove(current.key)
+        self._users[entry.id] = entry
+        self._keys.add(entry.key)
+
+    def remove(self, user_id: int) -> None:
+        current = self._users.pop(user_id, None)
+        if current is not None:
+            self._keys.remove(current.key)
+
+    def record(self, row) -> None:
+        """Apply the RETURNING row of a committed wallet update"""
+        current = self._users.get(row.id)
+        if current is None:
+            return  # not known here yet; the next sync() adds it
+        self.upsert(RankedUser(
+            id=row.id,
+            username=current.username,
+            total_games=row.total_games,
+            total_wagered_cents=row.total_wagered_cents,
+            total_won_cents=row.total_won_cents,
+            balance_cents=row.balance_cents,
+            version=row.version,
+            created_at=current.created_at
+        ))
+
+    def top(self, limit: int, cursor: Optional[str] = None) -> List[Tuple[int, RankedUser]]:
+        """(rank, entry) pairs for one page, starting after ``cursor``"""
+        start = self._keys.bisect_right(decode_cursor(cursor)) if cursor else 0
+        return [
+            (rank, self._users[key[1]])
+            for rank, key in enumerate(self._keys.islice(start, start + limit), start + 1)
+        ]
+
+    def rank(self, user_id: int) -> Optional[Tuple[int, RankedUser]]:
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+        return self._keys.index(entry.key) + 1, entry
+
+    async def sync(self, db: AsyncSession) -> None:
+        """Load everything on first use, then pull rows changed elsewhere"""
+        if self._loaded and time.monotonic() - self._synced_at < self.refresh_seconds:
+            return
+        async with self._lock:
+            if self._loaded and time.monotonic() - self._synced_at < self.refresh_seconds:
+                return
+            started = datetime.utcnow()
+            query = select(*_COLUMNS)
+            if self._loaded:
+                # Overlap the window to tolerate clock skew between replicas
+                # and rows the read replica had not replayed at the last sync
+                overlap = timedelta(seconds=self.refresh_seconds + self.lag_seconds)
+                query = query.where(User.updated_at >= self._watermark - overlap)
+            for row in (await db.execute(query)).all():
+                if not row.is_active:
+                    self.remove(row.id)
+                    continue
+                self.upsert(RankedUser.from_row(row))
+            self._loaded = True
+            self._watermark = started
+            self._synced_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            'users': len(self._users),
+            'loaded': self._loaded,
+        }
+
+def _build_index() -> LeaderboardIndex:
+    settings = get_settings()
+    return LeaderboardIndex(
+        settings.leaderboard_refresh_seconds,
+        settings.read_replica_max_lag_seconds if settings.database_read_url else 0.0
+    )
+
+leaderboard = _build_index()
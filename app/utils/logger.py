@@ -1,7 +1,12 @@
 import logging
 import logging.handlers
 import os
+import queue
+import random
+import threading
+import time
 from datetime import datetime
+from typing import Dict, List, Optional
 from app.database import get_settings
 import json
 
@@ -9,44 +14,204 @@ import json
 LOGS_DIR = "/app/logs" if os.path.exists("/app") else "logs"
 os.makedirs(LOGS_DIR, exist_ok=True)
 
+# Records written per wake-up of the listener thread
+LOG_BATCH_SIZE = 256
+
 class SanitizedFormatter(logging.Formatter):
-    """Custom formatter that sanitizes sensitive information"""
-    
+    """Custom formatter that sanitizes sensitive information.
+
+    Structured fields passed as ``extra={'event': {...}}`` are appended to
+    the message as JSON. Dict messages and event fields get the same
+    treatment: sensitive keys are redacted and long strings truncated.
+    """
+
     SENSITIVE_KEYS = {'password', 'pwd', 'secret', 'token', 'authorization', 'api_key', 'credit_card'}
-    
+    MAX_VALUE_CHARS = 1000
+
     def format(self, record):
-        # Create a copy of the record
+        if isinstance(record.msg, dict) or getattr(record, 'event', None) is not None:
+            # Copy so other handlers still see the record as logged
+            record = logging.makeLogRecord(record.__dict__)
         if isinstance(record.msg, dict):
-            # If message is a dict, sanitize it
-            sanitized = self._sanitize_dict(record.msg.copy())
-            record.msg = sanitized
-        
+            record.msg = self._sanitize_dict(record.msg)
+
+        event = getattr(record, 'event', None)
+        if event is not None:
+            record.msg = f"{record.msg}: {json.dumps(self._sanitize_dict(event), default=str)}"
+
         # Format the message
         result = super().format(record)
         return result
-    
+
     def _sanitize_dict(self, data: dict) -> dict:
-        """Recursively sanitize dictionary"""
-        for key in data:
-            if any(sensitive in key.lower() for sensitive in self.SENSITIVE_KEYS):
-                data[key] = "***REDACTED***"
-            elif isinstance(data[key], dict):
-                data[key] = self._sanitize_dict(data[key])
-        return data
+        """Recursively sanitized copy of a dictionary"""
+        return {
+            key: "***REDACTED***" if any(sensitive in str(key).lower() for sensitive in self.SENSITIVE_KEYS)
+            else self._sanitize_value(value)
+            for key, value in data.items()
+        }
+
+    def _sanitize_value(self, value):
+        if isinstance(value, dict):
+            return self._sanitize_dict(value)
+        if isinstance(value, (list, tuple)):
+            return [self._sanitize_value(item) for item in value]
+        if isinstance(value, str) and len(value) > self.MAX_VALUE_CHARS:
+            return value[:self.MAX_VALUE_CHARS] + "...[truncated]"
+        return value
+
+class JsonFormatter(SanitizedFormatter):
+    """One JSON object per line; dict messages and event fields become top-level keys"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        if isinstance(record.msg, dict):
+            fields = self._sanitize_dict(record.msg)
+        else:
+            entry['message'] = record.getMessage()
+            fields = {}
+        event = getattr(record, 'event', None)
+        if event is not None:
+            fields.update(self._sanitize_dict(event))
+        # Fields never replace the record's own time, level and logger
+        entry.update({key: value for key, value in fields.items() if key not in entry})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class LogStats:
+    """Counters for records that never reached a handler"""
+
+    def __init__(self):
+        self.enqueued = 0
+        self.dropped = 0  # queue full
+        self.sampled_out = 0
+        self.rate_limited = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'sampled_out': self.sampled_out,
+            'rate_limited': self.rate_limited,
+        }
+
+log_stats = LogStats()
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue without blocking; a full queue drops the record and counts it"""
+
+    def prepare(self, record):
+        # Same-process queue: hand the record over as is and let the
+        # listener thread do all the formatting
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            log_stats.enqueued += 1
+        except queue.Full:
+            log_stats.dropped += 1
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """Drains the queue in batches and flushes each handler once per batch"""
+
+    def _monitor(self):
+        q = self.queue
+        while True:
+            records = [q.get()]
+            while len(records) < LOG_BATCH_SIZE:
+                try:
+                    records.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(record is self._sentinel for record in records)
+            self._write([record for record in records if record is not self._sentinel])
+            for _ in records:
+                q.task_done()
+            if stop:
+                return
+
+    def _write(self, records: List[logging.LogRecord]) -> None:
+        for handler in self.handlers:
+            handler.acquire()
+            try:
+                for record in records:
+                    # What handler.handle() would check, without its
+                    # per-record lock and flush
+                    if record.levelno < handler.level:
+                        continue
+                    filtered = handler.filter(record)
+                    if not filtered:
+                        continue
+                    if isinstance(filtered, logging.LogRecord):
+                        record = filtered
+                    try:
+                        if isinstance(handler, logging.handlers.RotatingFileHandler) and handler.shouldRollover(record):
+                            handler.doRollover()
+                        handler.stream.write(handler.format(record) + handler.terminator)
+                    except Exception:
+                        handler.handleError(record)
+                handler.flush()
+            finally:
+                handler.release()
+
+class ActionFilter:
+    """Per-action sampling and per-second rate caps for action logs"""
+
+    def __init__(self, sample_rates: Dict[str, float], rate_limit: int):
+        self.sample_rates = sample_rates
+        self.rate_limit = rate_limit
+        self._windows: Dict[str, list] = {}
+
+    def allow(self, action: str) -> bool:
+        rate = self.sample_rates.get(action, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            log_stats.sampled_out += 1
+            return False
+        if self.rate_limit > 0:
+            now = int(time.monotonic())
+            window = self._windows.get(action)
+            if window is None or window[0] != now:
+                window = self._windows[action] = [now, 0]
+            if window[1] >= self.rate_limit:
+                log_stats.rate_limited += 1
+                return False
+            window[1] += 1
+        return True
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """"cell_clicked=0.1,game_started=1" -> {"cell_clicked": 0.1, ...}"""
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            action, rate = item.split("=", 1)
+            rates[action.strip()] = float(rate)
+    return rates
+
+_action_filter = ActionFilter({}, 0)
+_listener: Optional[BatchingQueueListener] = None
+_listener_lock = threading.Lock()
 
 def setup_logging():
     """Setup application logging"""
+    global _action_filter, _listener
     settings = get_settings()
     log_level = settings.log_level
-    
+
     # Create logger
     logger = logging.getLogger()
     logger.setLevel(log_level)
-    
+
     # Remove existing handlers
+    stop_logging()
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
-    
+
     # File handler with rotation
     file_handler = logging.handlers.RotatingFileHandler(
         os.path.join(LOGS_DIR, "app.log"),
@@ -54,73 +219,101 @@ def setup_logging():
         backupCount=5
     )
     file_handler.setLevel(log_level)
-    
+
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(log_level)
-    
+
     # Formatter
-    formatter = SanitizedFormatter(
+    formatter_class = JsonFormatter if settings.log_format == "json" else SanitizedFormatter
+    formatter = formatter_class(
         fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
-    
+
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
-    
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+
+    if settings.log_queue_size > 0:
+        # Request code only enqueues; a background thread does the I/O
+        log_queue = queue.Queue(maxsize=settings.log_queue_size)
+        logger.addHandler(DroppingQueueHandler(log_queue))
+        with _listener_lock:
+            _listener = BatchingQueueListener(
+                log_queue, file_handler, console_handler, respect_handler_level=True
+            )
+            _listener.start()
+    else:
+        logger.addHandler(file_handler)
+        logger.addHandler(console_handler)
+
+    _action_filter = ActionFilter(
+        parse_sample_rates(settings.log_sample_rates),
+        settings.log_action_rate_limit
+    )
+
     return logger
 
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
 def log_user_action(action: str, user_id: int, details: dict = None, level: str = "INFO"):
     """Log user actions without sensitive data"""
+    if not _action_filter.allow(action):
+        return
     logger = logging.getLogger(__name__)
-    
+
     log_data = {
         'action': action,
         'user_id': user_id,
         'timestamp': datetime.utcnow().isoformat(),
     }
-    
+
     if details:
         # Remove sensitive fields
-        sanitized_details = {k: v for k, v in details.items() 
+        sanitized_details = {k: v for k, v in details.items()
                             if not any(s in k.lower() for s in ['password', 'token', 'secret'])}
         log_data['details'] = sanitized_details
-    
+
     log_func = getattr(logger, level.lower(), logger.info)
-    log_func(f"User Action: {json.dumps(log_data)}")
+    log_func("User Action", extra={'event': log_data})
 
 def log_game_action(action: str, user_id: int, game_id: int, details: dict = None):
     """Log game-related actions"""
+    if not _action_filter.allow(action):
+        return
     logger = logging.getLogger(__name__)
-    
+
     log_data = {
         'action': action,
         'user_id': user_id,
         'game_id': game_id,
         'timestamp': datetime.utcnow().isoformat(),
     }
-    
+
     if details:
         log_data['details'] = details
-    
-    logger.info(f"Game Action: {json.dumps(log_data)}")
+
+    logger.info("Game Action", extra={'event': log_data})
 
 def log_error(error_msg: str, error_type: str, user_id: int = None, context: dict = None):
-    """Log error with context"""
+    """Log error with context (never sampled)"""
     logger = logging.getLogger(__name__)
-    
+
     log_data = {
         'error': error_msg,
         'error_type': error_type,
         'timestamp': datetime.utcnow().isoformat(),
     }
-    
+
     if user_id:
         log_data['user_id'] = user_id
     if context:
         log_data['context'] = context
-    
-    logger.error(f"Error: {json.dumps(log_data)}")
+
+    logger.error("Error", extra={'event': log_data})
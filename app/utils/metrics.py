@@ -0,0 +1,276 @@
+"""Prometheus metrics served on /metrics.
+
+Request metrics come from MetricsMiddleware, labelled by route template
+(``/api/games/{game_id}/click``) so ids don't explode the label set.
+Statements per request are read from the request's QueryProfile (see
+query_profiler), so the profiler middleware must wrap this one.
+
+Checkout waits and failures are reported by the engines' pool class
+(app.database.TimedQueuePool); hold times and new connections come from
+pool event listeners on each engine. Both carry over to the new pool when
+an engine is disposed. Pool occupancy, the bcrypt queue and the in-process
+caches are read when scraped. Event-loop lag is measured by a background task that
+sleeps LOOP_LAG_INTERVAL seconds and records how late it woke up.
+
+Under several workers (PROMETHEUS_MULTIPROC_DIR set, see gunicorn.conf.py)
+the histograms, counters and gauges above are merged across workers; the
+scrape-time gauges describe the worker that answered.
+"""
+import asyncio
+import os
+import time
+import weakref
+from typing import Optional
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+from app.utils.query_profiler import current_profile
+import logging
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL = 0.5
+
+def _metric(metric_type, name: str, documentation: str, labelnames=(), **kwargs):
+    """Create a metric, or reuse the one an earlier import of this module registered"""
+    existing = REGISTRY._names_to_collectors.get(name)
+    if existing is not None:
+        return existing
+    return metric_type(name, documentation, labelnames, **kwargs)
+
+REQUEST_LATENCY = _metric(
+    Histogram,
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+REQUESTS_IN_PROGRESS = _metric(
+    Gauge,
+    "http_requests_in_progress",
+    "HTTP requests being served",
+    ["method", "route"],
+    multiprocess_mode="livesum"
+)
+QUERIES_PER_REQUEST = _metric(
+    Histogram,
+    "db_queries_per_request",
+    "SQL statements executed per HTTP request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34)
+)
+POOL_WAIT = _metric(
+    Histogram,
+    "db_pool_checkout_seconds",
+    "Time to get a connection from the pool",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+POOL_TIMEOUTS = _metric(
+    Counter,
+    "db_pool_checkout_failures_total",
+    "Pool checkouts that raised (timeout or connect error)",
+    ["engine"]
+)
+POOL_CONNECTS = _metric(
+    Counter,
+    "db_pool_connections_opened_total",
+    "New database connections opened by the pool",
+    ["engine"]
+)
+POOL_HELD = _metric(
+    Histogram,
+    "db_pool_checkout_held_seconds",
+    "Time a connection stays checked out of the pool",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+LOOP_LAG = _metric(
+    Gauge,
+    "event_loop_lag_seconds",
+    "How late the last event-loop probe woke up",
+    multiprocess_mode="livemax"
+)
+LOOP_LAG_HISTOGRAM = _metric(
+    Histogram,
+    "event_loop_lag_seconds_distribution",
+    "How late event-loop probes woke up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+_instrumented_engines: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+def observe_checkout(name: str, wait_seconds: float, failed: bool) -> None:
+    POOL_WAIT.labels(name).observe(wait_seconds)
+    if failed:
+        POOL_TIMEOUTS.labels(name).inc()
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Count new connections and time how long checkouts are held on one (sync) engine"""
+    if engine in _instrumented_engines:
+        return
+    _instrumented_engines.add(engine)
+
+    def on_connect(dbapi_connection, connection_record):
+        POOL_CONNECTS.labels(name).inc()
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    def on_checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            POOL_HELD.labels(name).observe(time.perf_counter() - started)
+
+    event.listen(engine, "connect", on_connect)
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+
+class RuntimeCollector:
+    """Gauges read from the pools and in-process components at scrape time"""
+
+    def collect(self):
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Connections in use", labels=["engine"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Connections opened beyond pool_size", labels=["engine"])
+        idle = GaugeMetricFamily("db_pool_idle", "Pooled connections not in use", labels=["engine"])
+        from app.database import built_engines, get_settings, pool_limits
+        for name, engine in built_engines().items():
+            pool = engine.pool
+            if not hasattr(pool, "checkedout"):
+                continue  # NullPool (SQLite async) keeps nothing to report
+            checked_out.add_metric([name], pool.checkedout())
+            overflow.add_metric([name], max(0, pool.overflow()))
+            idle.add_metric([name], pool.checkedin())
+        yield checked_out
+        yield overflow
+        yield idle
+        pool_size, max_overflow = pool_limits(get_settings())
+        yield GaugeMetricFamily("db_pool_size", "pool_size of the engine serving requests", value=pool_size)
+        yield GaugeMetricFamily("db_pool_max_overflow", "max_overflow of the engine serving requests", value=max_overflow)
+
+        from app.utils.password_pool import password_hasher
+        from app.utils.game_cache import game_cache
+        from app.utils.game_events import game_events
+        from app.utils.logger import log_stats
+        hasher = password_hasher.stats()
+        yield GaugeMetricFamily("password_hash_pending", "bcrypt jobs queued or running", value=hasher['pending'])
+        yield GaugeMetricFamily("password_hash_queue_limit", "bcrypt jobs admitted at once", value=hasher['max_pending'])
+        yield GaugeMetricFamily("password_hash_workers", "bcrypt worker processes", value=hasher['workers'])
+        yield CounterMetricFamily("password_hash_rejected", "bcrypt jobs turned away with 503", value=hasher['rejected'])
+        yield GaugeMetricFamily("active_games_cached", "Games held by the active-game cache", value=game_cache.stats()['entries'])
+        yield GaugeMetricFamily("game_events_pending", "Game events waiting to be written", value=game_events.stats()['pending'])
+        yield CounterMetricFamily("log_records_dropped", "Log records dropped on a full queue", value=log_stats.dropped)
+
+        from app.utils.single_flight import single_flight
+        executed = CounterMetricFamily("single_flight_executed", "Shared computations run", labels=["name"])
+        coalesced = CounterMetricFamily("single_flight_coalesced", "Requests that waited for a computation already in flight", labels=["name"])
+        for name, calls in single_flight.stats()['calls'].items():
+            executed.add_metric([name], calls['executed'])
+            coalesced.add_metric([name], calls['coalesced'])
+        yield executed
+        yield coalesced
+
+        from app.utils.read_replica import replica_monitor
+        if replica_monitor.enabled:
+            yield GaugeMetricFamily("db_replica_healthy", "1 while reads may go to the replica", value=int(replica_monitor.healthy))
+            if replica_monitor.lag_seconds is not None:
+                yield GaugeMetricFamily("db_replica_lag_seconds", "Replication lag at the last probe", value=replica_monitor.lag_seconds)
+            reads = CounterMetricFamily("db_read_sessions", "Sessions opened by read-only routes", labels=["target"])
+            reads.add_metric(["replica"], replica_monitor.replica_reads)
+            reads.add_metric(["primary"], replica_monitor.primary_reads)
+            yield reads
+
+def resolve_route(app, scope) -> str:
+    """Path template of the route that will serve this request"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+class MetricsMiddleware:
+    """Per-route latency, in-flight count and query count for HTTP requests"""
+
+    def __init__(self, app, router_app=None):
+        self.app = app
+        self.router_app = router_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = resolve_route(self.router_app, scope)
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_LATENCY.labels(method, route, str(status_code[0])).observe(time.perf_counter() - started)
+            profile = current_profile.get()
+            if profile is not None:
+                QUERIES_PER_REQUEST.labels(route).observe(profile.queries)
+            in_progress.dec()
+
+class LoopLagMonitor:
+    """Background probe of event-loop responsiveness"""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            LOOP_LAG.set(lag)
+            LOOP_LAG_HISTOGRAM.observe(lag)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+loop_lag = LoopLagMonitor()
+# Registered with REGISTRY by setup_metrics, once per process; an earlier
+# import's collector is reused rather than registered twice
+_runtime_collector = REGISTRY._names_to_collectors.get("db_pool_size") or RuntimeCollector()
+
+def setup_metrics(app) -> None:
+    """Instrument the app and every engine it builds; call once at import time"""
+    from app.database import on_engine_created, on_pool_checkout
+    on_engine_created(lambda name, engine: instrument_engine(engine, name))
+    on_pool_checkout(observe_checkout)
+    if REGISTRY._names_to_collectors.get("db_pool_size") is None:
+        REGISTRY.register(_runtime_collector)
+    app.add_middleware(MetricsMiddleware, router_app=app)
+
+def render_metrics() -> tuple:
+    """(body, content type) for the /metrics response"""
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_runtime_collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
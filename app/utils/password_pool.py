@@ -0,0 +1,153 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import forkserver
+from functools import lru_cache
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+from app.database import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+@lru_cache()
+def build_crypt_context(rounds: int) -> CryptContext:
+    """bcrypt context pinned to one cost factor.
+
+    Pinning min/max to the target makes passlib flag any hash with a
+    different cost as needing an update, in either direction.
+    """
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds
+    )
+
+# Worker entry points (run inside the process pool)
+def _hash_password(password: str, rounds: int) -> str:
+    return build_crypt_context(rounds).hash(password)
+
+def _verify_and_update(password: str, hashed_password: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    return build_crypt_context(rounds).verify_and_update(password, hashed_password)
+
+def _worker_context():
+    """Start method for hash workers.
+
+    The app process runs threads (the log writer, the database driver's),
+    and forking it could hand a worker a lock some thread was holding.
+    forkserver forks workers from a separate single-threaded server;
+    spawn is the fallback where it is unavailable.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+# Set in the fork server's environment, so every hash worker forked from
+# it has it; start() is a no-op there
+HASH_WORKER_ENV = "PASSWORD_HASH_WORKER"
+
+def _start_fork_server() -> None:
+    os.environ[HASH_WORKER_ENV] = "1"
+    try:
+        forkserver.ensure_running()
+    finally:
+        del os.environ[HASH_WORKER_ENV]
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full and the request should be retried"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+class PasswordHashPool:
+    """Runs bcrypt in a dedicated process pool with admission control.
+
+    At most ``max_pending`` hash/verify jobs may be queued or running at
+    once; further callers are rejected immediately with PasswordHasherBusy
+    instead of piling up behind the pool.
+    """
+
+    def __init__(self, workers: int, max_pending: int, rounds: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.pending = 0
+        self.rejected = 0
+        self.completed = 0
+        self._avg_seconds = 0.1
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        """Create the pool; call before starting other threads"""
+        if os.environ.get(HASH_WORKER_ENV):
+            return  # a hash worker importing the app's main module
+        if self._executor is None:
+            context = _worker_context()
+            if context.get_start_method() == "forkserver":
+                # Preload only what workers run; the default re-imports __main__
+                context.set_forkserver_preload([__name__])
+                _start_fork_server()
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            logger.info(f"Password hash pool started with {self.workers} workers")
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until the current backlog drains"""
+        return max(1, math.ceil(self._avg_seconds * self.pending / self.workers))
+
+    async def _submit(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy(self.retry_after())
+
+        self.start()
+        if self._executor is None:
+            # run_in_executor(None, ...) would quietly hash on the thread pool
+            raise RuntimeError("Password hash pool is not running")
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            elapsed = time.perf_counter() - started
+            self._avg_seconds = 0.9 * self._avg_seconds + 0.1 * elapsed
+
+    async def hash(self, password: str) -> str:
+        """Hash a password at the configured cost factor"""
+        return await self._submit(_hash_password, password, self.rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password; returns (valid, new_hash) where new_hash is set
+        when the stored hash uses a different cost factor than configured"""
+        return await self._submit(_verify_and_update, password, hashed_password, self.rounds)
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'rejected': self.rejected,
+            'completed': self.completed,
+        }
+
+def _build_pool() -> PasswordHashPool:
+    settings = get_settings()
+    # Cores are shared by the server's worker processes
+    workers = settings.hash_workers or max(1, (os.cpu_count() or 1) // settings.web_concurrency)
+    max_pending = settings.hash_queue_size or workers * 8
+    return PasswordHashPool(workers, max_pending, settings.bcrypt_rounds)
+
+password_hasher = _build_pool()
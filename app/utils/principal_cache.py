@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from app.database import get_settings
+
+@dataclass(frozen=True)
+class Principal:
+    """Authenticated caller resolved from a bearer token"""
+    id: int
+    username: str
+    is_active: bool
+
+class PrincipalCache:
+    """Per-process TTL cache of verified tokens -> Principal.
+
+    Saves the JWT decode and the users lookup on every authenticated
+    request. Entries live for at most ``ttl_seconds`` (and never past the
+    token's own expiry).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Principal]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        principal, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return principal
+
+    def put(self, token: str, principal: Principal, token_exp: Optional[float] = None) -> None:
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl_seconds
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+        if ttl <= 0:
+            return
+        self._entries[token] = (principal, time.monotonic() + ttl)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+def _build_cache() -> PrincipalCache:
+    settings = get_settings()
+    return PrincipalCache(settings.principal_cache_max_entries, settings.principal_cache_ttl_seconds)
+
+principal_cache = _build_cache()
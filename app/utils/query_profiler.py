@@ -0,0 +1,167 @@
+"""Per-request SQL profiling.
+
+QueryProfilerMiddleware gives every HTTP request a QueryProfile (keyed
+by X-Request-ID, generated when the client sends none) held in a context
+variable. Cursor events on both engines add each statement's count and
+time to it; the variable follows the request into the async driver's
+greenlet and into threadpool calls in sync mode. Statements slower than
+SLOW_QUERY_MS are logged with the request id and kept for the debug
+endpoint.
+
+Routes declare how many statements they are expected to issue with
+``dependencies=[query_budget(n)]``. A request over budget is logged, or
+raises QueryBudgetExceeded when QUERY_BUDGET_ENFORCE is set, which is
+meant for test runs. QUERY_DEBUG adds X-Query-Count / X-DB-Time-Ms
+response headers and turns on GET /api/debug/queries.
+"""
+import heapq
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.database import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Slowest statements kept per request, and recent entries kept for /api/debug/queries
+SLOWEST_PER_REQUEST = 5
+RECENT_PROFILES = 200
+RECENT_SLOW_QUERIES = 100
+STATEMENT_MAX_CHARS = 500
+
+class QueryBudgetExceeded(AssertionError):
+    """A route issued more statements than it declared with query_budget"""
+
+@dataclass
+class QueryProfile:
+    request_id: str
+    method: str
+    path: str
+    queries: int = 0
+    db_seconds: float = 0.0
+    budget: Optional[int] = None
+    slowest: List[Tuple[float, str]] = field(default_factory=list)
+
+    def record(self, seconds: float, statement: str) -> None:
+        self.queries += 1
+        self.db_seconds += seconds
+        entry = (seconds, statement[:STATEMENT_MAX_CHARS])
+        if len(self.slowest) < SLOWEST_PER_REQUEST:
+            heapq.heappush(self.slowest, entry)
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def as_dict(self) -> dict:
+        return {
+            'request_id': self.request_id,
+            'method': self.method,
+            'path': self.path,
+            'queries': self.queries,
+            'db_ms': round(self.db_seconds * 1000, 3),
+            'budget': self.budget,
+            'slowest': [
+                {'ms': round(seconds * 1000, 3), 'statement': statement}
+                for seconds, statement in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("query_profile", default=None)
+recent_profiles = deque(maxlen=RECENT_PROFILES)
+recent_slow_queries = deque(maxlen=RECENT_SLOW_QUERIES)
+
+# The start time lives on the statement's execution context: a failed
+# statement never reaches after_cursor_execute, and anything kept on the
+# pooled connection would outlive it.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record(seconds, statement)
+    if seconds * 1000 >= get_settings().slow_query_ms:
+        request_id = profile.request_id if profile else None
+        recent_slow_queries.append({
+            'request_id': request_id,
+            'ms': round(seconds * 1000, 3),
+            'statement': statement[:STATEMENT_MAX_CHARS],
+        })
+        logger.warning(
+            "Slow query",
+            extra={'event': {'request_id': request_id, 'ms': round(seconds * 1000, 3), 'statement': statement[:STATEMENT_MAX_CHARS]}}
+        )
+
+def install(engine: Engine) -> None:
+    """Profile statements run on one (sync) engine"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+def query_budget(limit: int):
+    """Route dependency declaring the most statements a request may issue"""
+    async def declare() -> None:
+        profile = current_profile.get()
+        if profile is not None:
+            profile.budget = limit
+    return Depends(declare)
+
+class QueryProfilerMiddleware:
+    """Attach a QueryProfile to each HTTP request and check its budget"""
+
+    def __init__(self, app):
+        self.app = app
+        settings = get_settings()
+        self.debug = settings.query_debug
+        self.enforce = settings.query_budget_enforce
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        profile = QueryProfile(request_id or uuid.uuid4().hex, scope["method"], scope["path"])
+        token = current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", profile.request_id.encode("latin-1")))
+                if self.debug:
+                    headers.append((b"x-query-count", str(profile.queries).encode()))
+                    headers.append((b"x-db-time-ms", f"{profile.db_seconds * 1000:.3f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            if self.debug:
+                recent_profiles.append(profile.as_dict())
+
+        if profile.budget is not None and profile.queries > profile.budget:
+            message = f"{profile.method} {profile.path} ran {profile.queries} queries (budget {profile.budget})"
+            if self.enforce:
+                raise QueryBudgetExceeded(message)
+            logger.warning(f"Query budget exceeded: {message}", extra={'event': profile.as_dict()})
+
+def setup_query_profiler(app) -> None:
+    """Profile every engine the app builds and wrap the app; call once at import time"""
+    from app.database import on_engine_created
+    on_engine_created(lambda name, engine: install(engine))
+    app.add_middleware(QueryProfilerMiddleware)
@@ -0,0 +1,203 @@
+"""Read-replica routing for read-only routes.
+
+With DATABASE_READ_URL set, routes that only read take their session from
+get_read_db, which uses the replica unless:
+
+- the client wrote recently. Every successful non-GET request sets a
+  cookie good for READ_AFTER_WRITE_SECONDS, and that client's reads go to
+  the primary until it expires, so the history fetched right after a
+  claim includes the claim whichever worker or replica serves it.
+  Moves over the WebSocket channel can't set cookies, so its handshake
+  sets one that lasts until the socket's token expires (plus the window).
+- the replica is marked down. A background probe measures replication
+  lag every READ_REPLICA_CHECK_SECONDS; a failed probe, lag over
+  READ_REPLICA_MAX_LAG_SECONDS or a failed connect marks it down, and
+  reads fall back to the primary until a probe succeeds again.
+
+Without DATABASE_READ_URL, get_read_db is get_async_db.
+"""
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from app.database import get_settings, create_async_session, create_read_session
+import logging
+
+logger = logging.getLogger(__name__)
+
+READ_AFTER_WRITE_COOKIE = "read_primary_until"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Seconds the standby is behind. A caught-up standby replays nothing, so
+# pg_last_xact_replay_timestamp() only counts while WAL is pending.
+POSTGRES_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+class ReplicaMonitor:
+    """Health and lag of the read replica, probed in the background"""
+
+    def __init__(self, url: str, check_seconds: float, max_lag_seconds: float):
+        self.enabled = bool(url)
+        self.is_postgres = self.enabled and make_url(url).get_backend_name() == "postgresql"
+        self.check_seconds = check_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.healthy = self.enabled
+        self.lag_seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.failures = 0
+
+    def mark_down(self, reason: str) -> None:
+        if self.healthy:
+            logger.warning(f"Read replica unavailable, reading from the primary: {reason}")
+        self.healthy = False
+        self.failures += 1
+
+    def mark_up(self) -> None:
+        if not self.healthy:
+            logger.info("Read replica available again")
+        self.healthy = True
+
+    async def _measure_lag(self) -> float:
+        db = create_read_session()
+        try:
+            if not self.is_postgres:
+                await db.execute(text("SELECT 1"))
+                return 0.0
+            return float((await db.execute(POSTGRES_LAG_QUERY)).scalar() or 0)
+        finally:
+            await db.close()
+
+    async def probe(self) -> None:
+        try:
+            self.lag_seconds = await asyncio.wait_for(self._measure_lag(), timeout=max(1.0, self.check_seconds))
+        except Exception as e:
+            self.mark_down(f"probe failed: {e!r}")
+            return
+        if self.lag_seconds > self.max_lag_seconds:
+            self.mark_down(f"lag {self.lag_seconds:.1f}s over {self.max_lag_seconds:.1f}s")
+        else:
+            self.mark_up()
+
+    async def _run(self) -> None:
+        while True:
+            await self.probe()
+            await asyncio.sleep(self.check_seconds)
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'healthy': self.healthy,
+            'lag_seconds': self.lag_seconds,
+            'replica_reads': self.replica_reads,
+            'primary_reads': self.primary_reads,
+            'failures': self.failures,
+        }
+
+def _build_monitor() -> ReplicaMonitor:
+    settings = get_settings()
+    return ReplicaMonitor(
+        url=settings.database_read_url,
+        check_seconds=settings.read_replica_check_seconds,
+        max_lag_seconds=settings.read_replica_max_lag_seconds
+    )
+
+replica_monitor = _build_monitor()
+
+def wrote_recently(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(READ_AFTER_WRITE_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+async def open_read_session(request: Optional[Request] = None):
+    """Replica session when it may serve this request, else a primary one.
+
+    Without a request (work shared by several requests) the client's
+    recent writes are not considered.
+    """
+    if replica_monitor.healthy and (request is None or not wrote_recently(request)):
+        db = create_read_session()
+        try:
+            # Connect now so an unreachable replica costs a fallback, not a 500
+            await db.connection()
+            replica_monitor.replica_reads += 1
+            return db
+        except Exception as e:
+            replica_monitor.mark_down(f"connect failed: {e!r}")
+            try:
+                await db.close()
+            except Exception:
+                pass
+    replica_monitor.primary_reads += 1
+    return create_async_session()
+
+@asynccontextmanager
+async def read_session(request: Optional[Request] = None):
+    """Session for reads: the replica when usable (see module docstring), else the primary"""
+    if replica_monitor.enabled:
+        db = await open_read_session(request)
+    else:
+        db = create_async_session()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+async def get_read_db(request: Request):
+    """Request-scoped session for read-only routes"""
+    async with read_session(request) as db:
+        yield db
+
+def read_after_write_cookie(until: float) -> bytes:
+    """Set-Cookie value sending the client's reads to the primary until ``until``"""
+    max_age = max(0, math.ceil(until - time.time()))
+    return (
+        f"{READ_AFTER_WRITE_COOKIE}={until:.3f}; Max-Age={max_age}; "
+        "Path=/; HttpOnly; SameSite=Lax"
+    ).encode("latin-1")
+
+class ReadAfterWriteMiddleware:
+    """Send a client's reads to the primary for a while after it writes"""
+
+    def __init__(self, app, window_seconds: float):
+        self.app = app
+        self.window_seconds = window_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = read_after_write_cookie(time.time() + self.window_seconds)
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie)]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+def setup_read_replica(app) -> None:
+    """Track client writes when a replica is configured; call once at import time"""
+    if replica_monitor.enabled:
+        app.add_middleware(ReadAfterWriteMiddleware, window_seconds=get_settings().read_after_write_seconds)
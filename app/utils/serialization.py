@@ -0,0 +1,92 @@
+"""Fast JSON for responses built from trusted rows.
+
+The app's default response class is ORJSONResponse. On top of that,
+routes that turn ORM rows (or in-process index entries) into a response
+schema can skip pydantic entirely: ``fields(schema, row)`` reads the
+schema's fields off the row as a plain dict, and returning
+``json_response(...)`` bypasses FastAPI's response_model validation,
+which would otherwise check every field a second time. The schema stays
+the contract (and the OpenAPI docs) because the field list comes from it.
+
+Only use this where the values already have the schema's types: columns
+and properties of our own models, not client input.
+
+Game state also comes in a compact variant (COMPACT_JSON) for clients
+that ask for it with ``Accept``; see ``accepts``.
+"""
+from functools import lru_cache
+from typing import Any, Iterable, List, Mapping, Optional, Tuple, Type
+import orjson
+from fastapi.responses import ORJSONResponse
+from fastapi import Request
+from pydantic import BaseModel
+
+# Same options ORJSONResponse renders with, for bodies cached as bytes
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# Game state with the board as bitmasks instead of a cell map
+COMPACT_JSON = "application/vnd.mines.compact+json"
+
+@lru_cache(maxsize=None)
+def _schema_fields(schema: Type[BaseModel]) -> Tuple[Tuple[str, bool, Any], ...]:
+    return tuple(
+        (name, field.is_required(), None if field.is_required() else field.get_default(call_default_factory=True))
+        for name, field in schema.model_fields.items()
+    )
+
+def fields(schema: Type[BaseModel], row: Any, exclude_none: bool = False, **overrides) -> dict:
+    """The ``schema`` fields of ``row`` as a dict, unvalidated.
+
+    Keyword arguments supply or replace fields; optional fields the row
+    lacks take the schema default, a missing required one raises
+    AttributeError. With ``exclude_none``, fields that come out None are
+    left out, like response_model_exclude_none.
+    """
+    # Loaded ORM columns sit in the instance dict; reading them there skips
+    # the instrumented descriptor. Properties and expired columns fall back
+    # to getattr, which loads them as usual.
+    loaded = getattr(row, "__dict__", None) or {}
+    data = {}
+    for name, required, default in _schema_fields(schema):
+        if name in overrides:
+            data[name] = overrides[name]
+        elif name in loaded:
+            data[name] = loaded[name]
+        elif required:
+            data[name] = getattr(row, name)
+        else:
+            data[name] = getattr(row, name, default)
+    if exclude_none:
+        return {name: value for name, value in data.items() if value is not None}
+    return data
+
+def rows(schema: Type[BaseModel], items: Iterable[Any]) -> List[dict]:
+    return [fields(schema, item) for item in items]
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+def json_response(
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Mapping[str, str]] = None,
+    media_type: Optional[str] = None
+) -> ORJSONResponse:
+    """Response sent as-is, without response_model validation"""
+    return ORJSONResponse(content, status_code=status_code, headers=headers, media_type=media_type)
+
+def accepts(request: Request, media_type: str) -> bool:
+    """True if the Accept header names ``media_type`` with a non-zero q"""
+    for part in request.headers.get("accept", "").split(","):
+        name, *params = part.split(";")
+        if name.strip().lower() != media_type:
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
@@ -0,0 +1,54 @@
+"""Request coalescing for expensive computations.
+
+SingleFlight.run(key, fn) starts ``fn()`` as a task unless a call with
+the same key is already in flight on this worker, in which case the
+caller waits for that task instead. Every caller gets the same result or
+exception. The task is shielded, so a caller that goes away (client
+disconnect) neither cancels the work for the others nor leaves it half
+done. ``fn`` should therefore not depend on resources owned by a single
+request, such as that request's database session.
+
+Keys are tuples whose first item names the computation; counters are
+kept per name.
+"""
+import asyncio
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """Share one in-flight call among concurrent callers with the same key"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.executed: Dict[str, int] = defaultdict(int)
+        self.coalesced: Dict[str, int] = defaultdict(int)
+
+    async def run(self, key: Tuple, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+            self.executed[key[0]] += 1
+        else:
+            self.coalesced[key[0]] += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Tuple, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller has gone
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self._calls),
+            'calls': {
+                name: {'executed': self.executed[name], 'coalesced': self.coalesced[name]}
+                for name in sorted(set(self.executed) | set(self.coalesced))
+            },
+        }
+
+single_flight = SingleFlight()
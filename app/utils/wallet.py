@@ -0,0 +1,113 @@
+"""Balance changes as single conditional UPDATE statements.
+
+Each helper changes users in one ``UPDATE ... RETURNING`` (no prior
+SELECT, so no read-modify-write race and no long row lock), bumps
+User.version, and appends the matching ledger row and casino aggregate
+deltas to the same session.
+The caller commits, so the wallet change, the ledger entry and any game
+update land in one transaction.
+"""
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional
+from sqlalchemy import case, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import User, LedgerEntry, LedgerEntryType
+from app.utils.casino_aggregates import add_to_aggregates
+
+STARTING_BALANCE_CENTS = 100000
+
+class InsufficientFunds(Exception):
+    """The user's balance does not cover the requested debit"""
+
+def to_cents(amount: float) -> int:
+    """Convert a currency amount to integer cents (half-up)"""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+def from_cents(cents: int) -> float:
+    return cents / 100
+
+_RETURNING = (
+    User.id,
+    User.balance_cents,
+    User.total_wagered_cents,
+    User.total_won_cents,
+    User.total_games,
+    User.version,
+)
+
+def record_entry(
+    db: AsyncSession,
+    user_id: int,
+    entry_type: LedgerEntryType,
+    amount_cents: int,
+    balance_after_cents: int,
+    game_id: Optional[int] = None
+) -> None:
+    db.add(LedgerEntry(
+        user_id=user_id,
+        game_id=game_id,
+        entry_type=entry_type.value,
+        amount_cents=amount_cents,
+        balance_after_cents=balance_after_cents
+    ))
+
+async def debit_bet(db: AsyncSession, user_id: int, amount_cents: int, game_id: int) -> Row:
+    """Take a bet from the balance if it covers it; raises InsufficientFunds"""
+    row = (await db.execute(
+        update(User)
+        .where(User.id == user_id, User.balance_cents >= amount_cents)
+        .values(
+            balance_cents=User.balance_cents - amount_cents,
+            total_wagered_cents=User.total_wagered_cents + amount_cents,
+            total_games=User.total_games + 1,
+            version=User.version + 1,
+            updated_at=datetime.utcnow()
+        )
+        .returning(*_RETURNING)
+        .execution_options(synchronize_session=False)
+    )).one_or_none()
+    if row is None:
+        raise InsufficientFunds()
+
+    record_entry(db, user_id, LedgerEntryType.BET, -amount_cents, row.balance_cents, game_id)
+    await add_to_aggregates(db, user_id, wagered_cents=amount_cents, games=1)
+    return row
+
+async def credit_payout(
+    db: AsyncSession,
+    user_id: int,
+    amount_cents: int,
+    game_id: int,
+    multiplier: float
+) -> Row:
+    """Pay out a claimed prize and count the win"""
+    row = (await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            balance_cents=User.balance_cents + amount_cents,
+            total_won_cents=User.total_won_cents + amount_cents,
+            won_games=User.won_games + 1,
+            best_multiplier=case((User.best_multiplier < multiplier, multiplier), else_=User.best_multiplier),
+            biggest_win_cents=case((User.biggest_win_cents < amount_cents, amount_cents), else_=User.biggest_win_cents),
+            version=User.version + 1,
+            updated_at=datetime.utcnow()
+        )
+        .returning(*_RETURNING)
+        .execution_options(synchronize_session=False)
+    )).one()
+
+    record_entry(db, user_id, LedgerEntryType.PAYOUT, amount_cents, row.balance_cents, game_id)
+    await add_to_aggregates(db, user_id, won_cents=amount_cents)
+    return row
+
+async def record_loss(db: AsyncSession, user_id: int) -> None:
+    """Count a lost game; the stake was already taken by debit_bet"""
+    await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(lost_games=User.lost_games + 1)
+        .execution_options(synchronize_session=False)
+    )
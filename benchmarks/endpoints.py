@@ -0,0 +1,315 @@
+"""Endpoint latency benchmark.
+
+Runs the app in-process behind httpx's ASGI transport (no server, no
+network) against a throwaway SQLite database, or any DATABASE_URL given
+with --database-url, and has --users concurrent players go through a
+realistic session: register, log in, then --rounds rounds of new game,
+a few clicks and a claim, checking the leaderboard, stats and history
+every few rounds. --ws-users of the players make their moves over the
+/ws/game channel instead of REST, and the report compares per-message
+latency there with the REST click.
+
+Reports throughput and p50/p95/p99 per endpoint, writes them as JSON and,
+given --baseline, exits non-zero when any endpoint's p95 or the overall
+throughput is more than --threshold worse than the baseline.
+
+    python -m benchmarks.endpoints --users 10 --rounds 50 --output bench.json
+    python -m benchmarks.endpoints --baseline bench.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from statistics import mean, quantiles
+from typing import Dict, List, Optional, Sequence
+
+GRID_SIZE = 5
+MINES_COUNT = 3
+BET_AMOUNT = 1.0
+
+# Attempts per request when the app sheds load with 503 + Retry-After
+MAX_ATTEMPTS = 5
+
+class InProcessSocket:
+    """WebSocket client for the app in-process, like httpx's ASGITransport for HTTP"""
+
+    def __init__(self, app, path: str, query: str):
+        self.app = app
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 0),
+            "server": ("bench", 80),
+            "subprotocols": [],
+        }
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._from_app: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        self._task = asyncio.create_task(self.app(self.scope, self._to_app.get, self._from_app.put))
+        await self._to_app.put({"type": "websocket.connect"})
+        message = await self._from_app.get()
+        if message["type"] != "websocket.accept":
+            raise ConnectionError(f"WebSocket rejected: {message.get('reason')}")
+
+    async def request(self, payload: dict) -> dict:
+        await self._to_app.put({"type": "websocket.receive", "text": json.dumps(payload)})
+        message = await self._from_app.get()
+        if message["type"] != "websocket.send":
+            raise ConnectionError(f"WebSocket closed: {message.get('reason')}")
+        return json.loads(message["text"])
+
+    async def close(self) -> None:
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        await self._task
+
+class Recorder:
+    """Latencies (seconds), retries and error counts per endpoint"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.retries: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def call(self, client, name: str, method: str, url: str, **kwargs):
+        """Latency includes any waits the app asked for, as a client sees it"""
+        started = time.perf_counter()
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            response = await client.request(method, url, **kwargs)
+            retry_after = response.headers.get("Retry-After")
+            if response.status_code != 503 or retry_after is None or attempt == MAX_ATTEMPTS:
+                break
+            self.retries[name] += 1
+            await asyncio.sleep(float(retry_after))
+        self.latencies[name].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+    async def send(self, socket: InProcessSocket, name: str, message: dict) -> dict:
+        """One WebSocket message and its reply"""
+        started = time.perf_counter()
+        reply = await socket.request(message)
+        self.latencies[name].append(time.perf_counter() - started)
+        if reply.get("type") == "error":
+            self.errors[name] += 1
+        return reply
+
+def percentile_ms(samples: List[float], pct: int) -> float:
+    if len(samples) == 1:
+        return samples[0] * 1000
+    return quantiles(samples, n=100, method="inclusive")[pct - 1] * 1000
+
+async def check_views(client, recorder: Recorder, headers: dict) -> None:
+    await recorder.call(client, "GET /api/user/leaderboard", "GET", "/api/user/leaderboard", headers=headers)
+    await recorder.call(client, "GET /api/user/stats", "GET", "/api/user/stats", headers=headers)
+    await recorder.call(client, "GET /api/games/user/history", "GET", "/api/games/user/history", headers=headers)
+
+async def login(client, recorder: Recorder, player: int, rng: random.Random) -> Optional[str]:
+    credentials = {"username": f"bench{player}_{rng.randrange(10**9)}", "password": "benchpass123"}
+    await recorder.call(client, "POST /api/auth/register", "POST", "/api/auth/register", json=credentials)
+    response = await recorder.call(client, "POST /api/auth/login", "POST", "/api/auth/login", json=credentials)
+    return response.json()["access_token"] if response.status_code == 200 else None
+
+async def play(client, recorder: Recorder, player: int, rounds: int, rng: random.Random) -> None:
+    """One player's session over REST"""
+    token = await login(client, recorder, player, rng)
+    if token is None:
+        return
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for round_no in range(rounds):
+        response = await recorder.call(
+            client, "POST /api/games/new", "POST", "/api/games/new", headers=headers,
+            json={"bet_amount": BET_AMOUNT, "grid_size": GRID_SIZE, "mines_count": MINES_COUNT}
+        )
+        if response.status_code != 200:
+            return
+        game_id = response.json()["id"]
+
+        cells = rng.sample(range(GRID_SIZE * GRID_SIZE), rng.randint(1, 5))
+        game_status = "active"
+        for cell in cells:
+            response = await recorder.call(
+                client, "POST /api/games/{id}/click", "POST", f"/api/games/{game_id}/click",
+                headers=headers, json={"row": cell // GRID_SIZE, "col": cell % GRID_SIZE}
+            )
+            game_status = response.json().get("status") if response.status_code == 200 else None
+            if game_status != "active":
+                break
+        if game_status == "active":
+            await recorder.call(
+                client, "POST /api/games/{id}/claim", "POST", f"/api/games/{game_id}/claim", headers=headers
+            )
+
+        if round_no % 5 == 0:
+            await check_views(client, recorder, headers)
+
+async def play_ws(app, client, recorder: Recorder, player: int, rounds: int, rng: random.Random) -> None:
+    """The same session with moves sent over /ws/game"""
+    token = await login(client, recorder, player, rng)
+    if token is None:
+        return
+    headers = {"Authorization": f"Bearer {token}"}
+    socket = InProcessSocket(app, "/ws/game", f"token={token}")
+    await socket.connect()
+    try:
+        for round_no in range(rounds):
+            reply = await recorder.send(socket, "WS new_game", {
+                "type": "new_game", "bet_amount": BET_AMOUNT, "grid_size": GRID_SIZE, "mines_count": MINES_COUNT
+            })
+            if reply["type"] != "game":
+                return
+
+            cells = rng.sample(range(GRID_SIZE * GRID_SIZE), rng.randint(1, 5))
+            game_status = "active"
+            for cell in cells:
+                reply = await recorder.send(socket, "WS click", {
+                    "type": "click", "row": cell // GRID_SIZE, "col": cell % GRID_SIZE
+                })
+                game_status = reply.get("status")
+                if game_status != "active":
+                    break
+            if game_status == "active":
+                await recorder.send(socket, "WS claim", {"type": "claim"})
+
+            if round_no % 5 == 0:
+                await check_views(client, recorder, headers)
+    finally:
+        await socket.close()
+
+async def run(users: int, rounds: int, seed: int, ws_users: int) -> dict:
+    import httpx
+    import main
+
+    await main.startup_event()
+    recorder = Recorder()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                play_ws(main.app, client, recorder, player, rounds, random.Random(seed + player))
+                if player < ws_users else
+                play(client, recorder, player, rounds, random.Random(seed + player))
+                for player in range(users)
+            ))
+            elapsed = time.perf_counter() - started
+    finally:
+        await main.shutdown_event()
+
+    endpoints = {}
+    for name, samples in sorted(recorder.latencies.items()):
+        endpoints[name] = {
+            "count": len(samples),
+            "errors": recorder.errors[name],
+            "retries": recorder.retries[name],
+            "throughput": len(samples) / elapsed,
+            "mean_ms": mean(samples) * 1000,
+            "p50_ms": percentile_ms(samples, 50),
+            "p95_ms": percentile_ms(samples, 95),
+            "p99_ms": percentile_ms(samples, 99),
+        }
+    requests = sum(endpoint["count"] for endpoint in endpoints.values())
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "database": os.environ["DATABASE_URL"].split("@")[-1],
+            "users": users,
+            "ws_users": ws_users,
+            "rounds": rounds,
+            "seed": seed,
+            "python": platform.python_version(),
+            "elapsed_s": elapsed,
+        },
+        "total": {
+            "requests": requests,
+            "errors": sum(recorder.errors.values()),
+            "retries": sum(recorder.retries.values()),
+            "throughput": requests / elapsed,
+        },
+        "endpoints": endpoints,
+    }
+
+def compare(result: dict, baseline: dict, threshold: float) -> List[str]:
+    """Regressions beyond ``threshold`` (0.2 = 20% worse) as readable lines"""
+    regressions = []
+    for name, current in result["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous and current["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append(
+                f"{name}: p95 {previous['p95_ms']:.2f} ms -> {current['p95_ms']:.2f} ms"
+            )
+    previous = baseline.get("total", {}).get("throughput")
+    if previous and result["total"]["throughput"] < previous * (1 - threshold):
+        regressions.append(
+            f"throughput {previous:.1f} -> {result['total']['throughput']:.1f} req/s"
+        )
+    return regressions
+
+def print_report(result: dict) -> None:
+    print(f"{'endpoint':<32} {'count':>6} {'err':>4} {'retry':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, e in result["endpoints"].items():
+        print(
+            f"{name:<32} {e['count']:>6} {e['errors']:>4} {e['retries']:>5} {e['throughput']:>8.1f} "
+            f"{e['p50_ms']:>8.2f} {e['p95_ms']:>8.2f} {e['p99_ms']:>8.2f}"
+        )
+    total = result["total"]
+    print(f"{'total':<32} {total['requests']:>6} {total['errors']:>4} {total['retries']:>5} {total['throughput']:>8.1f}")
+    rest, ws = result["endpoints"].get("POST /api/games/{id}/click"), result["endpoints"].get("WS click")
+    if rest and ws:
+        print(f"click p99: REST {rest['p99_ms']:.2f} ms, WebSocket {ws['p99_ms']:.2f} ms")
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.endpoints", description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10, help="Concurrent players")
+    parser.add_argument("--rounds", type=int, default=50, help="Games per player")
+    parser.add_argument("--ws-users", type=int, help="Players moving over /ws/game (default: half)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", help="Default: a temporary SQLite file")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    # Settings are read on import, so configure the app before loading it
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    ws_users = args.users // 2 if args.ws_users is None else min(args.ws_users, args.users)
+    result = asyncio.run(run(args.users, args.rounds, args.seed, ws_users))
+    print_report(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if result["total"]["errors"]:
+        print(f"{result['total']['errors']} requests failed", file=sys.stderr)
+        return 1
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            print(f"Regressions over {args.threshold:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
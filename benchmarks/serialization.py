@@ -0,0 +1,135 @@
+"""Serialization cost per response, before and after the trusted-row path.
+
+"before" is what FastAPI did with these routes' return values: build
+the schema objects by hand (GameHistory.model_validate per row,
+UserStats(...) per leaderboard entry), validate them again against the
+route's response_model, and render with the stdlib-json JSONResponse.
+"after" is the current path: schema fields read straight off the rows
+(app.utils.serialization) and rendered by orjson. Both sides start from
+in-memory rows, so no database time is included, and each pair is
+checked to decode to the same JSON before it is timed.
+
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --rows 20,100 --repeat 7
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Sequence
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from app.models import Game, GameStatus
+from app.schemas import GameHistory, GameState, Leaderboard, UserStats
+from app.utils.game_engine import GameEngine
+from app.utils.leaderboard import RankedUser
+from app.utils.serialization import dumps, fields, json_response, rows
+from app.routes.users import ranked_stats
+
+def response_field(response_type):
+    """The field FastAPI builds once per route from its response_model"""
+    return create_response_field(name="Response", type_=response_type, mode="serialization")
+
+def fastapi_render(field, content) -> bytes:
+    """What FastAPI does with a route's return value: validate against response_model, then JSONResponse"""
+    coroutine = serialize_response(field=field, response_content=content)
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return JSONResponse(done.value).body
+    raise RuntimeError("serialize_response awaited unexpectedly")
+
+def make_games(count: int) -> List[Game]:
+    started = datetime(2024, 1, 1)
+    games = []
+    for i in range(count):
+        game = Game(
+            id=i + 1,
+            user_id=1,
+            bet_cents=100 + i,
+            grid_size=5,
+            mines_count=3,
+            status=(GameStatus.WON, GameStatus.LOST, GameStatus.CLAIMED)[i % 3].value,
+            current_multiplier=1.0 + i / 100,
+            prize_cents=(i * 37) % 500,
+            state_version=i,
+            created_at=started + timedelta(minutes=i),
+            updated_at=started + timedelta(minutes=i, seconds=30)
+        )
+        GameEngine.store_board(game, 0b111, GameEngine.full_mask(5))
+        games.append(game)
+    return games
+
+def make_ranking(count: int) -> list:
+    joined = datetime(2024, 1, 1)
+    return [
+        (rank, RankedUser(
+            id=rank,
+            username=f"player{rank}",
+            total_games=1000 - rank,
+            total_wagered_cents=500000 - rank * 7,
+            total_won_cents=480000 - rank * 11,
+            balance_cents=100000 + rank,
+            version=rank,
+            created_at=joined + timedelta(hours=rank)
+        ))
+        for rank in range(1, count + 1)
+    ]
+
+def cases(row_counts: Sequence[int]):
+    """(name, before, after) per endpoint shape"""
+    history_field = response_field(list[GameHistory])
+    for count in row_counts:
+        games = make_games(count)
+        yield (
+            f"history page ({count} rows)",
+            lambda games=games: fastapi_render(history_field, [GameHistory.model_validate(g) for g in games]),
+            lambda games=games: json_response(rows(GameHistory, games)).body,
+        )
+    page = make_ranking(100)
+    leaderboard_field = response_field(Leaderboard)
+    yield (
+        "leaderboard (100 rows)",
+        lambda: fastapi_render(leaderboard_field, Leaderboard(
+            users=[UserStats(**ranked_stats(rank, entry)) for rank, entry in page],
+            total_users=len(page),
+            next_cursor=None
+        )),
+        lambda: dumps(fields(
+            Leaderboard, None,
+            users=[ranked_stats(rank, entry) for rank, entry in page],
+            total_users=len(page),
+            next_cursor=None
+        )),
+    )
+    game = make_games(1)[0]
+    game_field = response_field(GameState)
+    yield (
+        "game state",
+        lambda: fastapi_render(game_field, GameState.model_validate(game)),
+        lambda: json_response(fields(GameState, game)).body,
+    )
+
+def per_call_us(fn: Callable[[], bytes], repeat: int) -> float:
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialization", description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="20,100", help="History page sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per case (best is reported)")
+    args = parser.parse_args(argv)
+
+    print(f"{'response':<26} {'before us':>10} {'after us':>10} {'speedup':>8}")
+    for name, before, after in cases([int(n) for n in args.rows.split(",")]):
+        if json.loads(before()) != json.loads(after()):
+            raise SystemExit(f"{name}: before and after render different JSON")
+        before_us = per_call_us(before, args.repeat)
+        after_us = per_call_us(after, args.repeat)
+        print(f"{name:<26} {before_us:>10.1f} {after_us:>10.1f} {before_us / after_us:>7.1f}x")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,196 @@
+"""Monte Carlo check of GameEngine payouts against their exact expectation.
+
+A strategy "cash out after k safe clicks" wins iff the first k cells a
+player opens are all safe. On a uniformly random board the order the
+player opens cells in does not matter, so each simulated game is one
+shuffled board and the only statistic needed is the position of its
+first mine: the game pays out for every k up to that position. One batch
+of boards therefore scores every cash-out strategy at once, and workers
+only send back a histogram of first-mine positions.
+
+Boards are shuffled in NumPy batches of CHUNK_SIZE games and the batches
+are spread over a process pool. Payouts use the same multiplier table and
+cent rounding as the game (GameEngine.calculate_prize).
+
+Run with ``python -m benchmarks.simulator`` (``--help`` for options); needs
+numpy from requirements-dev.txt.
+"""
+import argparse
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from fractions import Fraction
+from statistics import NormalDist
+from typing import Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from app.utils.game_engine import GameEngine
+
+# Games shuffled per NumPy batch (a 10x10 batch is ~6.5 MB of booleans)
+CHUNK_SIZE = 65536
+
+@dataclass
+class StrategyResult:
+    grid_size: int
+    mines_count: int
+    cashout_after: int
+    games: int
+    win_rate: float
+    rtp: float
+    variance: float
+    ci_low: float
+    ci_high: float
+    expected_win_rate: float
+    expected_rtp: float
+    expected_variance: float
+
+    @property
+    def within_ci(self) -> bool:
+        return self.ci_low <= self.expected_rtp <= self.ci_high
+
+def payout_ratio(grid_size: int, mines_count: int, cashout_after: int, bet_cents: int) -> Fraction:
+    """Prize / bet for a win after ``cashout_after`` safe clicks, in game cents"""
+    multiplier = GameEngine.multiplier_table(grid_size, mines_count)[cashout_after]
+    return Fraction(GameEngine.calculate_prize(bet_cents, multiplier), bet_cents)
+
+def win_probability(grid_size: int, mines_count: int, cashout_after: int) -> Fraction:
+    """P(the first ``cashout_after`` cells opened are all safe)"""
+    total_cells = grid_size * grid_size
+    safe_total = total_cells - mines_count
+    p = Fraction(1)
+    for k in range(cashout_after):
+        p *= Fraction(safe_total - k, total_cells - k)
+    return p
+
+def expected(grid_size: int, mines_count: int, cashout_after: int, bet_cents: int = 100) -> Tuple[float, float, float]:
+    """Exact (win probability, RTP, variance of prize / bet) for one strategy"""
+    p = win_probability(grid_size, mines_count, cashout_after)
+    ratio = payout_ratio(grid_size, mines_count, cashout_after, bet_cents)
+    rtp = p * ratio
+    return float(p), float(rtp), float(p * ratio * ratio - rtp * rtp)
+
+def first_mine_histogram(grid_size: int, mines_count: int, games: int, seed: np.random.SeedSequence) -> np.ndarray:
+    """Counts of games by number of safe cells opened before the first mine"""
+    rng = np.random.default_rng(seed)
+    total_cells = grid_size * grid_size
+    board = np.zeros(total_cells, dtype=bool)
+    board[:mines_count] = True
+    histogram = np.zeros(total_cells - mines_count + 1, dtype=np.int64)
+    while games > 0:
+        size = min(games, CHUNK_SIZE)
+        boards = rng.permuted(np.broadcast_to(board, (size, total_cells)), axis=1)
+        histogram += np.bincount(boards.argmax(axis=1), minlength=len(histogram))
+        games -= size
+    return histogram
+
+def _split(games: int, parts: int) -> List[int]:
+    base, extra = divmod(games, parts)
+    return [base + (i < extra) for i in range(parts) if base + (i < extra)]
+
+def simulate(
+    configs: Iterable[Tuple[int, int]],
+    games: int,
+    cashouts: Optional[Sequence[int]] = None,
+    bet_cents: int = 100,
+    confidence: float = 0.95,
+    workers: Optional[int] = None,
+    seed: Optional[int] = None
+) -> List[StrategyResult]:
+    """Play ``games`` games of every (grid_size, mines_count) config.
+
+    Every config is scored for each cash-out point in ``cashouts`` (all
+    of 1..safe cells when None); configs and batches run in parallel.
+    """
+    configs = list(configs)
+    for grid_size, mines_count in configs:
+        if not 1 <= mines_count < grid_size * grid_size:
+            raise ValueError(f"Invalid board: {grid_size}x{grid_size} with {mines_count} mines")
+    workers = workers or os.cpu_count() or 1
+    parts = _split(games, max(1, min(workers, math.ceil(games / CHUNK_SIZE))))
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(configs) * len(parts)))
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            [pool.submit(first_mine_histogram, grid_size, mines_count, part, next(seeds)) for part in parts]
+            for grid_size, mines_count in configs
+        ]
+        results = []
+        for (grid_size, mines_count), config_futures in zip(configs, futures):
+            histogram = sum(future.result() for future in config_futures)
+            # Games that opened at least k safe cells before the first mine
+            survivors = np.cumsum(histogram[::-1])[::-1]
+            safe_total = grid_size * grid_size - mines_count
+            for k in cashouts or range(1, safe_total + 1):
+                if not 1 <= k <= safe_total:
+                    continue
+                ratio = float(payout_ratio(grid_size, mines_count, k, bet_cents))
+                win_rate = survivors[k] / games
+                rtp = win_rate * ratio
+                variance = win_rate * ratio * ratio - rtp * rtp
+                margin = z * math.sqrt(variance / games)
+                expected_win_rate, expected_rtp, expected_variance = expected(grid_size, mines_count, k, bet_cents)
+                results.append(StrategyResult(
+                    grid_size=grid_size,
+                    mines_count=mines_count,
+                    cashout_after=k,
+                    games=games,
+                    win_rate=float(win_rate),
+                    rtp=float(rtp),
+                    variance=float(variance),
+                    ci_low=float(rtp - margin),
+                    ci_high=float(rtp + margin),
+                    expected_win_rate=expected_win_rate,
+                    expected_rtp=expected_rtp,
+                    expected_variance=expected_variance
+                ))
+    return results
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.simulator",
+        description="Simulate games and compare RTP with the exact expectation"
+    )
+    parser.add_argument("--grid-sizes", type=_int_list, help="Default: GRID_SIZES")
+    parser.add_argument("--mines", type=_int_list, help="Mine counts (default: all)")
+    parser.add_argument("--cashouts", type=_int_list, help="Cash out after this many safe clicks (default: all)")
+    parser.add_argument("--games", type=int, default=1_000_000, help="Games per board config")
+    parser.add_argument("--bet-cents", type=int, default=100)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--workers", type=int, help="Processes (default: CPU count)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true", help="One JSON object per strategy")
+    args = parser.parse_args(argv)
+
+    configs = [
+        (grid_size, mines_count)
+        for grid_size in args.grid_sizes or GameEngine.allowed_grid_sizes()
+        for mines_count in args.mines or range(1, grid_size * grid_size)
+        if mines_count < grid_size * grid_size
+    ]
+    results = simulate(
+        configs, args.games, args.cashouts, args.bet_cents, args.confidence, args.workers, args.seed
+    )
+
+    if args.json:
+        for result in results:
+            print(json.dumps({**asdict(result), 'within_ci': result.within_ci}))
+    else:
+        print(f"{'grid':>4} {'mines':>5} {'cashout':>7} {'win rate':>9} {'rtp':>8} {'ci':>19} {'expected':>8}")
+        for r in results:
+            flag = "" if r.within_ci else "  <- outside CI"
+            print(
+                f"{r.grid_size:>4} {r.mines_count:>5} {r.cashout_after:>7} {r.win_rate:>9.5f} {r.rtp:>8.5f} "
+                f"[{r.ci_low:.5f}, {r.ci_high:.5f}] {r.expected_rtp:>8.5f}{flag}"
+            )
+    outside = sum(not result.within_ci for result in results)
+    if outside:
+        print(f"{outside} of {len(results)} strategies outside the {args.confidence:.0%} interval")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
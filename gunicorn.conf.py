@@ -0,0 +1,50 @@
+"""gunicorn settings for production: WEB_CONCURRENCY uvicorn workers.
+
+    gunicorn main:app -c gunicorn.conf.py
+
+Workers load the app after the fork (no preload_app), so each one starts
+its own log writer thread, hash pool, caches and database engines; the
+engines are sized from DB_CONNECTION_BUDGET when it is set (see
+app.database.pool_limits). The master only creates and migrates the
+schema, once, before any worker exists.
+
+Workers behave like separate replicas sharing a pod: in-process caches
+are per worker and writes are guarded by the same version checks.
+"""
+import os
+import shutil
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = False
+# Requests hold no per-worker state worth keeping, so recycle workers
+# now and then to cap slow leaks; jitter keeps them from restarting together
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "20000"))
+max_requests_jitter = max_requests // 10
+graceful_timeout = 30
+timeout = 60
+keepalive = 5
+accesslog = None
+
+if workers > 1:
+    # One scrape of /metrics should cover every worker, not whichever
+    # one answered it (see app.utils.metrics)
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus-multiproc")
+
+def on_starting(server):
+    """Create or upgrade the schema before any worker starts"""
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir)
+
+    from app.database import init_db, get_engine
+    init_db()
+    # Close the master's connections; workers build their own engines
+    get_engine().dispose()
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,15 +1,31 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
 import os
 import logging
 from pathlib import Path
 
-from app.database import init_db, get_settings
-from app.utils.logger import setup_logging
+from app.database import init_db, dispose_engines, get_settings
+from app.utils.logger import setup_logging, stop_logging, log_stats
+from app.utils.password_pool import password_hasher
+from app.utils.game_engine import GameEngine
+from app.utils.game_cache import game_cache
+from app.utils.principal_cache import principal_cache
+from app.utils.leaderboard import leaderboard
+from app.utils.game_events import game_events
+from app.utils.metrics import setup_metrics, render_metrics, loop_lag
+from app.utils.query_profiler import setup_query_profiler
+from app.utils.read_replica import setup_read_replica, replica_monitor
+from app.utils.http_cache import response_cache, make_etag, etag_matches, not_modified
+from app.utils.single_flight import single_flight
 from app.routes import auth, games, users, casino
 from app.routes import referrals
+from app.routes import ws
+from app.routes import debug
+
+# The hash pool's fork server must start before the log writer thread
+password_hasher.start()
 
 # Setup logging
 logger = setup_logging()
@@ -18,7 +34,8 @@ logger = setup_logging()
 app = FastAPI(
     title="Mine Gambling Game",
     description="A gambling mine sweeper game with user authentication",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Setup CORS
@@ -28,8 +45,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Request-ID", "ETag", "X-Query-Count", "X-DB-Time-Ms"],
 )
 
+if get_settings().metrics_enabled:
+    setup_metrics(app)
+# Outside the metrics middleware, which reads the request's query count
+setup_query_profiler(app)
+setup_read_replica(app)
+
 # Paths for static files and templates (code root dir)
 base_path = Path(__file__).resolve().parent
 static_path = base_path / "static"
@@ -46,6 +70,8 @@ app.include_router(games.router)
 app.include_router(users.router)
 app.include_router(casino.router)
 app.include_router(referrals.router)
+app.include_router(ws.router)
+app.include_router(debug.router)
 
 @app.on_event("startup")
 async def startup_event():
@@ -54,6 +80,13 @@ async def startup_event():
     try:
         init_db()
         logger.info("Database initialized successfully")
+        password_hasher.start()
+        GameEngine.build_multiplier_tables()
+        game_cache.start()
+        game_events.start()
+        replica_monitor.start()
+        if get_settings().metrics_enabled:
+            loop_lag.start()
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
         raise
@@ -62,12 +95,26 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down application")
+    await loop_lag.close()
+    await game_cache.close()
+    await game_events.close()
+    await replica_monitor.close()
+    password_hasher.shutdown()
+    await dispose_engines()
+    stop_logging()
+
+# The SPA shell is read once; browsers and nginx revalidate it by ETag
+index_page = index_file.read_bytes() if index_file.exists() else None
+index_etag = make_etag("index", index_page)
+INDEX_CACHE_CONTROL = "public, max-age=60"
 
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Serve main SPA or fallback to API info JSON"""
-    if index_file.exists():
-        return FileResponse(str(index_file))
+    if index_page is not None:
+        if etag_matches(request, index_etag):
+            return not_modified(index_etag, INDEX_CACHE_CONTROL)
+        return HTMLResponse(index_page, headers={"ETag": index_etag, "Cache-Control": INDEX_CACHE_CONTROL})
     return {
         "message": "Mine Gambling Game API",
         "docs": "/docs",
@@ -87,9 +134,27 @@ async def status():
     """API status endpoint"""
     return {
         "status": "online",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "caches": {
+            "principal": principal_cache.stats(),
+            "active_games": game_cache.stats(),
+            "leaderboard": leaderboard.stats(),
+            "responses": response_cache.stats()
+        },
+        "game_events": game_events.stats(),
+        "read_replica": replica_monitor.stats(),
+        "single_flight": single_flight.stats(),
+        "logging": log_stats.as_dict()
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    if not get_settings().metrics_enabled:
+        return Response(status_code=404)
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 if __name__ == "__main__":
     import uvicorn
     settings = get_settings()
@@ -4,6 +4,13 @@ let currentUser = null;
 let currentGame = null;
 const API_BASE = '/api';
 
+// Payout tables served by the backend, keyed by "gridSize:minesCount"
+const multiplierTables = {};
+
+// Game state is requested in its compact form: the board as hex bitmasks,
+// bit (row * grid_size + col), with mines only given for revealed cells
+const GAME_STATE_TYPE = 'application/vnd.mines.compact+json';
+
 // Initialization
 document.addEventListener('DOMContentLoaded', () => {
     handleReferralLanding();
@@ -40,8 +47,53 @@ document.addEventListener('DOMContentLoaded', () => {
     // Initial UI state
     setSettingsState(false);
     renderMineGrid();
+    loadGameConfig();
 });
 
+async function loadGameConfig() {
+    try {
+        // mines_count=1 keeps the payload small; we only need the grid sizes here
+        const response = await fetch(`${API_BASE}/games/multipliers?mines_count=1`);
+        if (!response.ok) return;
+
+        const data = await response.json();
+        const select = document.getElementById('grid-size');
+        if (!select || !data.grid_sizes.length) return;
+
+        const selected = parseInt(select.value);
+        select.innerHTML = '';
+        data.grid_sizes.forEach(size => {
+            const option = document.createElement('option');
+            option.value = size;
+            option.textContent = `${size}x${size}`;
+            select.appendChild(option);
+        });
+        select.value = data.grid_sizes.includes(selected) ? selected : data.grid_sizes[0];
+
+        handleSettingsChange();
+    } catch (error) {
+        console.error('Config error:', error);
+    }
+}
+
+async function loadMultiplierTable(gridSize, minesCount) {
+    const key = `${gridSize}:${minesCount}`;
+    if (multiplierTables[key]) return multiplierTables[key];
+
+    try {
+        const response = await fetch(`${API_BASE}/games/multipliers?grid_size=${gridSize}&mines_count=${minesCount}`);
+        if (!response.ok) return null;
+
+        const data = await response.json();
+        if (data.tables.length) {
+            multiplierTables[key] = data.tables[0].multipliers;
+        }
+    } catch (error) {
+        console.error('Multiplier table error:', error);
+    }
+    return multiplierTables[key] || null;
+}
+
 function handleReferralLanding() {
     const params = new URLSearchParams(window.location.search);
     const refCode = params.get('ref');
@@ -239,7 +291,7 @@ async function startGame() {
     try {
         const response = await fetch(`${API_BASE}/games/new`, {
             method: 'POST',
-            headers: getAuthHeaders(),
+            headers: getGameStateHeaders(),
             body: JSON.stringify({
                 bet_amount: betAmount,
                 grid_size: gridSize,
@@ -252,7 +304,8 @@ async function startGame() {
             throw new Error(message);
         }
         
-        currentGame = await response.json();
+        currentGame = decodeGameState(await response.json());
+        await loadMultiplierTable(currentGame.grid_size, currentGame.mines_count);
 
         // Refresh user profile so balance reflects the placed bet
         await loadUserProfile();
@@ -275,9 +328,9 @@ async function clickCell(row, col) {
     if (!currentGame) return;
     
     try {
-        const response = await fetch(`${API_BASE}/games/${currentGame.id}/click`, {
+        const response = await fetch(`${API_BASE}/games/${currentGame.id}/click?include_state=true`, {
             method: 'POST',
-            headers: getAuthHeaders(),
+            headers: getGameStateHeaders(),
             body: JSON.stringify({ row, col })
         });
         
@@ -288,12 +341,8 @@ async function clickCell(row, col) {
         
         const result = await response.json();
         
-        // Reload game state
-        const gameResponse = await fetch(`${API_BASE}/games/${currentGame.id}`, {
-            headers: getAuthHeaders()
-        });
-        
-        currentGame = await gameResponse.json();
+        // The click response carries the updated game state
+        currentGame = decodeGameState(result.game);
         
         updateGameInfo();
         renderMineGrid();
@@ -500,6 +549,21 @@ async function showLeaderboard() {
             console.error('Casino stats error:', e);
         }
 
+        // Show the player's own position, even when it is off this page
+        const myRank = document.getElementById('my-rank');
+        myRank.textContent = '';
+        try {
+            const rankResp = await fetch(`${API_BASE}/user/rank`, {
+                headers: getAuthHeaders()
+            });
+            if (rankResp.ok) {
+                const me = await rankResp.json();
+                myRank.textContent = `Your rank: #${me.rank} of ${me.total_users}`;
+            }
+        } catch (e) {
+            console.error('Rank error:', e);
+        }
+
         document.getElementById('leaderboard-screen').classList.remove('hidden');
         
     } catch (error) {
@@ -529,15 +593,14 @@ function renderMineGrid() {
             cell.className = 'cell';
             
             if (currentGame) {
-                const cellKey = `${row},${col}`;
-                const isRevealed = currentGame.revealed_cells[cellKey] !== undefined;
+                const isRevealed = isCellRevealed(row, col);
                 const status = currentGame.status;
 
                 if (status === 'active') {
                     // Standard in-play behavior: only show revealed cells, others clickable
                     if (isRevealed) {
                         cell.classList.add('revealed');
-                        if (currentGame.revealed_cells[cellKey]) {
+                        if (isCellMine(row, col)) {
                             cell.classList.add('mine');
                             cell.textContent = '💣';
                         } else {
@@ -548,10 +611,10 @@ function renderMineGrid() {
                         cell.onclick = () => clickCell(row, col);
                     }
                 } else {
-                    // Game finished: reveal full board based on revealed_cells
+                    // Game finished: reveal full board based on the revealed mask
                     if (isRevealed) {
                         cell.classList.add('revealed');
-                        if (currentGame.revealed_cells[cellKey]) {
+                        if (isCellMine(row, col)) {
                             cell.classList.add('mine');
                             cell.textContent = '💣';
                         } else {
@@ -573,6 +636,14 @@ function updateGameInfo() {
     document.getElementById('current-bet').textContent = currentGame.bet_amount.toFixed(2);
     document.getElementById('current-multiplier').textContent = currentGame.current_multiplier;
     document.getElementById('current-prize').textContent = currentGame.prize_amount.toFixed(2);
+
+    const nextEl = document.getElementById('next-multiplier');
+    if (nextEl) {
+        const table = multiplierTables[`${currentGame.grid_size}:${currentGame.mines_count}`];
+        const safeClicks = countBits(currentGame.revealed & ~currentGame.mines);
+        const next = table && currentGame.status === 'active' ? table[safeClicks + 1] : undefined;
+        nextEl.textContent = next !== undefined ? next : '-';
+    }
 }
 
 function updateUserDisplay() {
@@ -692,6 +763,13 @@ function handleSettingsChange() {
         gridDiv.classList.add('disabled');
     }
 
+    // At least one cell on the board must stay safe
+    const gridSize = parseInt(document.getElementById('grid-size').value) || 3;
+    const minesInput = document.getElementById('mines-count');
+    if (minesInput) {
+        minesInput.max = gridSize * gridSize - 1;
+    }
+
     renderMineGrid();
 }
 
@@ -716,3 +794,44 @@ function getAuthHeaders() {
         'Authorization': `Bearer ${apiToken}`
     };
 }
+
+function getGameStateHeaders() {
+    return { ...getAuthHeaders(), 'Accept': GAME_STATE_TYPE };
+}
+
+// Game state with the board as BigInt masks, from either representation
+function decodeGameState(state) {
+    const { revealed_cells, grid, ...game } = state;
+    if (revealed_cells === undefined) {
+        game.revealed = BigInt(`0x${state.revealed}`);
+        game.mines = BigInt(`0x${state.mines}`);
+        return game;
+    }
+    game.revealed = 0n;
+    game.mines = 0n;
+    for (const [key, isMine] of Object.entries(revealed_cells)) {
+        const [row, col] = key.split(',').map(Number);
+        const bit = 1n << BigInt(row * game.grid_size + col);
+        game.revealed |= bit;
+        if (isMine) game.mines |= bit;
+    }
+    return game;
+}
+
+function cellBit(row, col) {
+    return 1n << BigInt(row * currentGame.grid_size + col);
+}
+
+function isCellRevealed(row, col) {
+    return (currentGame.revealed & cellBit(row, col)) !== 0n;
+}
+
+function isCellMine(row, col) {
+    return (currentGame.mines & cellBit(row, col)) !== 0n;
+}
+
+function countBits(mask) {
+    let count = 0;
+    for (; mask; mask &= mask - 1n) count++;
+    return count;
+}